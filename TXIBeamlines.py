@@ -0,0 +1,50 @@
+"""
+TXI beamline definitions shared by the ray trace studies
+"""
+
+import numpy as np
+
+from optics import Beamline, Collimator, CrissCrossSource, FlatMirror
+
+
+def SXR():
+    """ TXI SXR: PC2S -> M1K3 -> M2K3 -> PC1K3 -> PC2K3
+    """
+    primary = np.array([0., 0., 1.], dtype=np.float32)
+    PC2S  = Collimator('PC2S', (1.2500, 0.0, 731.145), 0.016, 0.055)
+    Src = CrissCrossSource((1.25, 0., 690.), PC2S.loc, 0.02, PC2S.iR*2)
+    M1K3  = FlatMirror('M1K3',
+                       location=(1.2500, 0.0, 735.422), size=(0.02, 0.02, 1.0),
+                       direction='x', A=-0.0098468, deltaA=(-0.00015, 0.00015),
+                       translation=(-0.001, 0.001), incidentNorm=primary)
+    primary = M1K3.out
+    M2K3  = FlatMirror('M2K3',
+                       location=(1.2184, 0.0, 737.022), size=(0.02, 0.02, 1.0),
+                       direction='x', A=-0.0098468, deltaA=(-0.00015, 0.00015),
+                       translation=(-0.001, 0.001), incidentNorm=primary)
+    PC1K3 = Collimator('PC1K3', (1.25, 0.0, 744.000), 0.008, 0.084)
+    #PC1K3 = Collimator('PC1K3', (0.0, 0.0, 744.0), 0.008, 0.084) NORMAL COLLIMATOR SIZE
+    PC1K3.setXYfromMirror(M2K3)
+    PC2K3 = Collimator('PC2K3', (0.687, 0.0, 750.503), 0.0145, 0.084)
+    return Beamline('TXI SXR', [PC2S, M1K3, M2K3, PC1K3, PC2K3], source=Src)
+
+
+def HXR():
+    """ TXI HXR: PC1H -> M1LO -> M1L1 -> PC1L1 -> PC2L1
+    """
+    primary = np.array([0., 0., 1.], dtype=np.float32)
+    PC1H  = Collimator('PC1H', (-1.2500, 0.0, 735.211), 0.008, 0.055)
+    Src = CrissCrossSource((-1.25, 0., 690.), PC1H.loc, 0.02, PC1H.iR*2)
+    M1LO  = FlatMirror('M1LO',
+                       location=(-1.2500, 0.0, 740.000), size=(0.02, 0.02, 1.0),
+                       direction='x', A=-0.0098468, deltaA=(-0.00015, 0.00015),
+                       translation=(-0.001, 0.001), incidentNorm=primary)
+    primary = M1LO.out
+    M1L1  = FlatMirror('M1L1',
+                       location=(-1.227, 0.0, 741.600), size=(0.02, 0.02, 1.0),
+                       direction='x', A=-0.0098468, deltaA=(-0.00015, 0.00015),
+                       translation=(-0.001, 0.001), incidentNorm=primary)
+    PC1L1 = Collimator('PC1L1', (-1.114, 0.0, 745.621), 0.008, 0.084)
+    PC1L1.setXYfromMirror(M1L1)
+    PC2L1 = Collimator('PC2L1', (-1.00, 0.0, 749.616), 0.0145, 0.084)
+    return Beamline('TXI HXR', [PC1H, M1LO, M1L1, PC1L1, PC2L1], source=Src)
@@ -0,0 +1,30 @@
+"""
+TXI SXR and HXR traced together from one shared source batch
+Usage: python TXICompare.py [--rays 1000000] [--chunk 100000] [--seed 0] [--workers 1] [--output DIR]
+"""
+
+import argparse
+import os
+
+from optics import MultiBeamline
+from TXIBeamlines import SXR, HXR
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TXI beamlines traced from one shared source batch')
+    parser.add_argument('--rays', type=int, default=1000000, help='number of source rays')
+    parser.add_argument('--chunk', type=int, default=100000, help='rays per chunk')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes')
+    parser.add_argument('--output', default=None, help='directory for the Tally .npz files')
+    args = parser.parse_args()
+
+    lines = MultiBeamline('TXI', [SXR(), HXR()])
+    tallies = lines.stream(args.rays, chunk=args.chunk, seed=args.seed, workers=args.workers)
+    for name, tally in tallies.items():
+        print('{:} ({:d} rays)'.format(name, tally.n_rays))
+        for comp, fraction in tally.fractions().items():
+            print('  {:12s} {:10.6f}'.format(comp, fraction))
+        if(args.output is not None):
+            os.makedirs(args.output, exist_ok=True)
+            tally.save(os.path.join(args.output, name.replace(' ', '_') + '.npz'))
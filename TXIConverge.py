@@ -0,0 +1,32 @@
+"""
+Absorbed and transmitted fractions of the TXI beamlines with confidence intervals,
+tracing until each reaches the requested relative standard error
+Usage: python TXIConverge.py [--line SXR] [--rtol 0.01] [--atol 0] [--batch 100000] [--max-rays N] [--seed 0] [--workers 1]
+"""
+
+import argparse
+
+from TXIBeamlines import SXR, HXR
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TXI beamline fractions to a target precision')
+    parser.add_argument('--line', choices=['SXR', 'HXR'], default='SXR', help='beamline')
+    parser.add_argument('--rtol', type=float, default=0.01, help='relative standard error target')
+    parser.add_argument('--atol', type=float, default=0., help='absolute standard error target')
+    parser.add_argument('--batch', type=int, default=100000, help='rays per batch')
+    parser.add_argument('--max-rays', type=int, default=100000000, help='stop after this many rays')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes')
+    args = parser.parse_args()
+
+    beamline = SXR() if(args.line == 'SXR') else HXR()
+    tally, intervals, converged = beamline.converge(rtol=args.rtol, atol=args.atol, batch=args.batch,
+                                                    seed=args.seed, workers=args.workers,
+                                                    max_rays=args.max_rays)
+    print('{:} after {:d} rays ({:})'.format(beamline.name, tally.n_rays,
+                                              'converged' if(converged) else 'NOT converged'))
+    print('{:12s} {:>12s} {:>12s} {:>12s} {:>12s}'.format('quantity', 'fraction', 'std error', '95% low', '95% high'))
+    for name, est in intervals.items():
+        print('{:12s} {:12.6g} {:12.3g} {:12.6g} {:12.6g}'.format(name, est['value'], est['error'],
+                                                                  est['low'], est['high']))
@@ -0,0 +1,44 @@
+"""
+Mirror angle scan of a TXI beamline rendered to an image sequence or a video
+Usage: python TXIScan.py [--line SXR] [--mirror M1K3] [--delta 0.0002] [--steps 21] [--rays 200]
+                         [--workers 2] [--fps 4] [--output scan.gif]
+"""
+
+import argparse
+import functools
+
+import numpy as np
+
+from optics import ScanAnimation
+from TXIBeamlines import SXR, HXR
+
+
+def setMirrorAngle(beamline, mirror, A):
+    """ Scan step: set the angle of a mirror
+    """
+    beamline[mirror].setA(A)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TXI mirror angle scan animation')
+    parser.add_argument('--line', choices=['SXR', 'HXR'], default='SXR', help='beamline')
+    parser.add_argument('--mirror', default='M1K3', help='mirror scanned')
+    parser.add_argument('--delta', type=float, default=0.0002, help='scan half range around the nominal angle (rad)')
+    parser.add_argument('--steps', type=int, default=21, help='number of scan steps')
+    parser.add_argument('--rays', type=int, default=200, help='source rays per step')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    parser.add_argument('--workers', type=int, default=2, help='tracing processes')
+    parser.add_argument('--fps', type=float, default=4, help='video frames per second')
+    parser.add_argument('--output', default='scan.gif',
+                        help='video file (.gif, .mp4, ...) or image pattern such as scan/{:04d}.png')
+    args = parser.parse_args()
+
+    beamline = SXR() if(args.line == 'SXR') else HXR()
+    A0 = beamline[args.mirror].A
+    angles = np.linspace(A0 - args.delta, A0 + args.delta, args.steps)
+    steps = [functools.partial(setMirrorAngle, mirror=args.mirror, A=A) for A in angles]
+
+    scan = ScanAnimation(beamline, steps, n=args.rays, seed=args.seed)
+    title = beamline.name + ' ' + args.mirror + ' step {:d}'
+    files = scan.save(args.output, fps=args.fps, workers=args.workers, title=title, limits={'zmin': 730.0})
+    print('{:d} steps written to {:}'.format(args.steps, files[0] if(len(files) == 1) else args.output))
@@ -0,0 +1,76 @@
+"""
+Ray tracing throughput benchmarks (rays per second)
+Usage: python benchmark.py [--sizes 1000 10000 ...] [--repeat 3] [--output benchmark.json]
+"""
+
+import argparse
+import json
+import platform
+import time
+
+import numpy as np
+
+from TXIBeamlines import SXR, HXR
+
+
+def bestTime(func, repeat):
+    """ Best wall time of func() over repeat runs
+    """
+    best = np.inf
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def runBenchmarks(sizes, repeat, seed=0):
+    """ Time source, mirror, collimator and full-beamline throughput at each bundle size
+    """
+    sxr = SXR()
+    hxr = HXR()
+    M1K3 = sxr['M1K3']
+    PC1K3 = sxr['PC1K3']
+
+    results = []
+    for n in sizes:
+        rng = np.random.default_rng(seed)
+        src_rays = sxr.source.getRays(n, rng)
+        pc1_rays = sxr.trace(src_rays, rng)[3].rays   # rays leaving M2K3
+
+        cases = [
+            ('CrissCrossSource.getRays', lambda: sxr.source.getRays(n, rng)),
+            ('FlatMirror.transport',     lambda: M1K3.transport(src_rays, rng)),
+            ('Collimator.transport',     lambda: PC1K3.transport(pc1_rays, rng)),
+            ('TXI SXR',                  lambda: sxr.run(n, rng)),
+            ('TXI HXR',                  lambda: hxr.run(n, rng)),
+            ('TXI SXR bundle',           lambda: sxr.runBundle(n, rng)),
+        ]
+        for name, func in cases:
+            t = bestTime(func, repeat)
+            results.append({'case': name, 'rays': n, 'seconds': t, 'rays_per_second': n / t})
+            print('{:28s} {:>10d} rays  {:10.4f} s  {:12.4g} rays/s'.format(name, n, t, n / t))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ray tracing throughput benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+                        help='bundle sizes in rays')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, best time is kept')
+    parser.add_argument('--output', default='benchmark.json', help='JSON result file')
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.sizes, args.repeat)
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('Results written to', args.output)
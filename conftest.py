@@ -0,0 +1 @@
+# pytest configuration: keeps the repository root (TXIBeamlines, optics) importable from tests/
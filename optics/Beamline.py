@@ -0,0 +1,492 @@
+import copy
+import hashlib
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .Tally import Tally
+from .Profiler import Profiler
+from .RayBundle import RayBundle
+from . import Kernels
+from . import geometry as g
+
+class Stage():
+  """ Ray state after one component of a beamline
+  Properties:
+  * name: str, component name ('source' for the input bundle)
+  * rays: (M,2,3) rays alive after the component
+  * alive: (N,) mask of the input rays still alive after the component
+  * mask: (M_in,) mask returned by the component on its incoming rays
+          (rays hitting a mirror, or rays absorbed by a collimator)
+  * jac: (M,P,2,3) derivatives of the point and unit direction of each ray w.r.t. the
+         P beamline parameters of Beamline.jacobianParams, or None if not traced
+  """
+  def __init__(self, name, rays, alive, mask=None, jac=None):
+    self.name = name
+    self.rays = rays
+    self.alive = alive
+    self.mask = mask
+    self.jac = jac
+
+
+class Beamline():
+  """
+  Class of a beamline, an ordered list of components transporting ray bundles
+  Properties:
+  * name: str, beamline name
+  * source: source component providing getRays(n, rng), or None
+  * components: list of components providing transport(rays, rng), in beam order
+  * profiler: Profiler recording each component transport, or None (disabled)
+  """
+  def __init__(self, name, components, source=None):
+    """
+    Parameters:
+        name: string of name
+        components: list of components in beam order
+        source: source of the input rays, e.g. CrissCrossSource
+    """
+    self.name = name
+    self.components = list(components)
+    self.source = source
+    self._cache = None   # (stages, component keys, generator before each component) of the last cached trace
+    self.profiler = None # Profiler recording each component transport, if set
+
+  def __getitem__(self, name):
+    """ Component by name
+    """
+    for comp in self.components:
+      if(comp.name == name):
+        return comp
+    raise KeyError('No component {:} in beamline {:}'.format(name, self.name))
+
+  def __getstate__(self):
+    # the stage cache is local to this process
+    state = self.__dict__.copy()
+    state['_cache'] = None
+    if(self.profiler is not None):   # workers profile from zero and return their records
+      state['profiler'] = Profiler()
+    return state
+
+  def trace(self, rays, rng=None, tally=None, cache=False, samples=None, jacobian=False):
+    """ Transport a ray bundle (N,2,3) through all components
+        Return a list of Stage, the input bundle followed by one per component.
+        rng: numpy.random.Generator for the component jitter (a new one if None)
+        tally: Tally filled in place by the components
+        cache: keep the stages for retrace()
+        samples: (N,ndim) samples in [0,1) for the component jitter instead of rng,
+                 ndim columns split over the components in order (see sampleDims)
+        jacobian: also give each stage the derivatives of its rays (Stage.jac) w.r.t. the
+                  translation and angle of every mirror (see jacobianParams); each ray point
+                  is its intersection with the component plane
+    """
+    if(rng is None):
+      rng = np.random.default_rng()
+    jac = None
+    if(jacobian):
+      jac = np.zeros((rays.shape[0], sum(self.sampleDims()[1]), 2, 3))
+    stages = [Stage('source', rays, np.ones(rays.shape[0], dtype=bool), jac=jac)]
+    if(cache):
+      self._cache = (stages, [], [], samples)
+    self._traceFrom(stages, rng, tally, samples)
+    if(tally is not None):
+      tally.count(rays.shape[0], stages[-1].rays.shape[0])
+    return list(stages) if(cache) else stages
+
+  def retrace(self):
+    """ Repeat the last cached trace after component changes (e.g. setA, setXYfromMirror)
+        Stages upstream of the first component whose parameters changed are re-used;
+        that component and all downstream ones are traced again, with the random
+        state they had in the cached trace, so the result equals a full re-trace.
+    """
+    if(self._cache is None):
+      raise Exception('No cached trace: call trace(..., cache=True) first')
+    stages, keys, rngs, samples = self._cache
+    first = len(self.components)
+    for i, comp in enumerate(self.components):
+      if(i >= len(keys) or paramKey(comp) != keys[i]):
+        first = i
+        break
+    if(first == len(self.components)):
+      return list(stages)
+    del stages[first+1:], keys[first:]
+    rng = rngs[first]
+    del rngs[first:]
+    self._traceFrom(stages, rng, samples=samples)
+    return list(stages)
+
+  def sampleDims(self):
+    """ Number of random samples per ray of the source, and of each component
+    """
+    return self.source._ndim, [getattr(comp, '_ndim', 0) for comp in self.components]
+
+  def jacobianParams(self):
+    """ (component name, parameter) of each column of Stage.jac:
+        the translation and rotation angle (as by setA or the deltaA jitter) of each mirror
+    """
+    params = []
+    for comp in self.components:
+      if(getattr(comp, '_ndim', 0) == 2):
+        params += [(comp.name, 'translation'), (comp.name, 'angle')]
+    return params
+
+  def _traceFrom(self, stages, rng, tally=None, samples=None):
+    """ Transport the last of stages through the remaining components, appending their stages
+    """
+    cached = self._cache is not None and self._cache[0] is stages
+    rays = stages[-1].rays
+    alive = stages[-1].alive
+    jac = stages[-1].jac
+    first = len(stages) - 1
+    dims = [getattr(comp, '_ndim', 0) for comp in self.components]
+    col = sum(dims[:first])
+    for comp, ndim in zip(self.components[first:], dims[first:]):
+      comp_samples = None
+      if(samples is not None and ndim > 0):
+        comp_samples = samples[alive, col:col+ndim]
+      if(cached):
+        self._cache[1].append(paramKey(comp))
+        self._cache[2].append(copy.deepcopy(rng))
+      if(jac is not None and comp_samples is None and ndim > 0):
+        # the jitter transport would draw, shared with the derivatives
+        comp_samples = np.stack([rng.random(rays.shape[0]) for k in range(ndim)], axis=1)
+      if(self.profiler is None):
+        out, mask = comp.transport(rays, rng, tally, comp_samples)
+      else:
+        out, mask = self.profiler.transport(comp, rays, rng, tally, comp_samples)
+      if(jac is not None):
+        jac = comp.tangent(rays, jac, comp_samples, col)
+      if(out.shape[0] < rays.shape[0]):  # rays removed by the component
+        alive = alive.copy()
+        alive[alive] = ~mask
+        if(jac is not None):
+          jac = jac[~mask]
+      stages.append(Stage(comp.name, out, alive, mask, jac))
+      rays = out
+      col += ndim
+
+  def run(self, n, rng=None, tally=None, sampler=None):
+    """ Generate n rays from the source and trace them through all components
+        sampler: Sampler drawing the source and jitter samples of all rays jointly
+                 (independent pseudo-random numbers from rng if None)
+    """
+    if(rng is None):
+      rng = np.random.default_rng()
+    if(sampler is None):
+      return self.trace(self.source.getRays(n, rng), rng, tally)
+    nsrc, dims = self.sampleDims()
+    samples = sampler.random(n, nsrc + sum(dims), rng)
+    rays = self.source.getRays(n, samples=samples[:,:nsrc])
+    return self.trace(rays, rng, tally, samples=samples[:,nsrc:])
+
+  def envelope(self, nrim=16, ngrid=16, niter=40, shrink=1e-9):
+    """ Envelope of the edge rays at each collimator plane, without random sampling
+        Every ray is traced for each combination of the range ends of all jitter samples
+        (each mirror at its extreme deltaA and translation).  Within one pattern of mirror
+        hits a ray maps smoothly to a plane, so the beam extremes come from the rays joining
+        the two source disk rims, or from rays grazing a mirror end.  The latter are found
+        by bisection on chords joining a rim point of one disk to a diameter of the other,
+        between grid points whose hit pattern differs.  All edge rays are then traced in
+        one bundle; the envelope converges to the exact one as nrim grows.
+        Return (envelope, stages): envelope is a dict of collimator name to dict of
+        rays: number of edge rays reaching the collimator
+        transmitted: number of them not absorbed
+        inside, outside: number transmitted through the aperture (radius < iR) and past the
+                         outer edge (radius > oR)
+        r_max: largest radius of the transmitted rays from the collimator center (nan if none)
+        low, high: (2,) footprint (x,y) extent of the transmitted rays on the collimator face
+        and stages are the traced stages of the edge rays, e.g. for Renderer.drawStages.
+        nrim: number of points on each disk rim, and of diameters of each disk
+        ngrid: grid points on each chord searched for a change of hit pattern
+        niter: bisection steps on each change (chord resolution 2**-niter)
+        shrink: relative distance of the rim points inside the disks
+    """
+    nsrc, dims = self.sampleDims()
+    nc = 2**sum(dims)
+    corners = np.array(list(itertools.product((0., 1.), repeat=sum(dims))), dtype=np.float64).reshape(nc, sum(dims))
+
+    # chord grid for every mirror setting: (nc, ngrid, nchord)
+    nchord = 2 * nrim * nrim
+    t = np.linspace(-1. + shrink, 1. - shrink, ngrid)
+    c, k, j = [a.ravel() for a in np.meshgrid(np.arange(nc), np.arange(ngrid), np.arange(nchord), indexing='ij')]
+    code = self._edgePatterns(self.source.chordSamples(nrim, j, t[k], shrink), corners[c]).reshape(nc, ngrid, nchord)
+
+    # bisect each change of pattern between neighbouring grid points
+    c, k, j = np.nonzero(code[:,1:] != code[:,:-1])
+    lo, hi = t[k], t[k+1]
+    code_lo = code[c, k, j]
+    for it in range(niter):
+      mid = 0.5 * (lo + hi)
+      same = self._edgePatterns(self.source.chordSamples(nrim, j, mid, shrink), corners[c]) == code_lo
+      lo = np.where(same, mid, lo)
+      hi = np.where(same, hi, mid)
+
+    rim = self.source.rimSamples(nrim, shrink)
+    src = np.concatenate([np.repeat(rim, nc, axis=0),
+                          self.source.chordSamples(nrim, j, lo, shrink),
+                          self.source.chordSamples(nrim, j, hi, shrink)])
+    jitter = np.concatenate([np.tile(corners, (rim.shape[0], 1)), corners[c], corners[c]])
+    stages = self.trace(self.source.getRays(src.shape[0], samples=src), samples=jitter)
+
+    envelope = {}
+    for comp, prev, stage in zip(self.components, stages[:-1], stages[1:]):
+      if(comp._flag != 'absorbed'):
+        continue
+      p0 = prev.rays[:,0]
+      ps = g.PlaneIntersection(p0, prev.rays[:,1] - p0, comp.loc, comp.norm)[~stage.mask]
+      r = np.linalg.norm(ps - comp.loc, axis=1)
+      uv = comp.footprint(ps)
+      empty = ps.shape[0] == 0
+      envelope[comp.name] = {
+        'rays': int(stage.mask.shape[0]),
+        'transmitted': int(ps.shape[0]),
+        'inside': int(np.count_nonzero(r < comp.iR)),
+        'outside': int(np.count_nonzero(r > comp.oR)),
+        'r_max': np.nan if(empty) else float(r.max()),
+        'low': np.full(2, np.nan) if(empty) else uv.min(axis=0),
+        'high': np.full(2, np.nan) if(empty) else uv.max(axis=0)}
+    return envelope, stages
+
+  def _edgePatterns(self, src, jitter):
+    """ (N,) code of the path of each ray given its source and jitter samples:
+        one base-3 digit per component, 0 not reached, 1 flagged, 2 not flagged
+    """
+    stages = self.trace(self.source.getRays(src.shape[0], samples=src), samples=jitter)
+    code = np.zeros(src.shape[0], dtype=np.int64)
+    for prev, stage in zip(stages[:-1], stages[1:]):
+      digit = np.zeros_like(code)
+      digit[prev.alive] = np.where(stage.mask, 1, 2)
+      code = code * 3 + digit
+    return code
+
+  def propagate(self, bundle, rng=None, tally=None, samples=None):
+    """ Transport a RayBundle in place through all components, without keeping stages
+        rng: numpy.random.Generator for the component jitter (a new one if None)
+        tally: Tally filled in place by the components
+        samples: (N,ndim) samples in [0,1) for the component jitter instead of rng (see sampleDims)
+    """
+    if(rng is None):
+      rng = np.random.default_rng()
+    n_rays = np.count_nonzero(bundle.alive)
+    col = 0
+    for comp in self.components:
+      ndim = getattr(comp, '_ndim', 0)
+      comp_samples = None
+      if(samples is not None and ndim > 0):
+        comp_samples = samples[:, col:col+ndim]
+      col += ndim
+      if(self.profiler is None):
+        comp.transport(bundle, rng, tally, comp_samples)
+      else:
+        self.profiler.transport(comp, bundle, rng, tally, comp_samples)
+    if(tally is not None):
+      tally.count(n_rays, np.count_nonzero(bundle.alive))
+    return bundle
+
+  def runBundle(self, n, rng=None, tally=None, sampler=None, dtype=np.float32, compiled=False):
+    """ Generate n rays from the source and transport them as a RayBundle
+        The compiled kernels (optics.Kernels) fuse the source and all components in one
+        parallel loop per ray; the NumPy path is propagate().  Both use the same samples
+        and give the same alive rays and tally; absorbed rays stay on the absorbing plane
+        with the kernels and are carried on with propagate().
+        rng: numpy.random.Generator for the samples (a new one if None)
+        sampler: Sampler drawing the source and jitter samples of all rays jointly
+        dtype: float dtype of the returned bundle (float32 as RayBundle; float64 matches trace())
+        compiled: True for the compiled kernels, False for NumPy (default), None for the
+                  kernels when Numba is installed; a profiler records the kernels as one entry
+    """
+    if(rng is None):
+      rng = np.random.default_rng()
+    if(compiled is None):
+      compiled = Kernels.available()
+    nsrc, dims = self.sampleDims()
+    if(sampler is None):
+      samples = rng.random((n, nsrc + sum(dims)))
+    else:
+      samples = sampler.random(n, nsrc + sum(dims), rng)
+    if(compiled):
+      if(self.profiler is None):
+        return Kernels.trace(self, samples, RayBundle(n, dtype), tally)
+      t0 = time.perf_counter()
+      bundle = Kernels.trace(self, samples, RayBundle(n, dtype), tally)
+      n_out = np.count_nonzero(bundle.alive)
+      self.profiler.record('kernel', time.perf_counter() - t0, n, n_out, absorbed=n - n_out)
+      return bundle
+    bundle = self.source.getBundle(n, samples=samples[:,:nsrc], dtype=dtype)
+    return self.propagate(bundle, rng, tally, samples[:,nsrc:])
+
+  def stream(self, n, chunk=100000, seed=None, tally=None, workers=1, cache=None, sink=None, sampler=None):
+    """ Trace n source rays chunk by chunk and fold each chunk into a Tally
+        Only one chunk of rays is held at a time per worker, so memory is set by chunk, not n.
+        Each chunk draws from its own SeedSequence.spawn stream, so the result for
+        a given (seed, n, chunk) is identical whatever the number of workers.
+        seed: int or numpy.random.SeedSequence (fresh entropy if None)
+        tally: Tally to accumulate into (a new one if None)
+        workers: number of processes (1 runs in this process; None uses all cores)
+        cache: ResultCache to look up and store the result (used only with a seed)
+        sink: RayStore receiving the stages of every chunk (needs workers=1; bypasses cache)
+        sampler: Sampler of the source and jitter samples (pseudo-random if None);
+                 chunk is rounded down to its chunkSize
+    """
+    if(tally is None):
+      tally = Tally(self.components)
+    if(sampler is not None):
+      chunk = sampler.chunkSize(chunk)
+    if(sink is not None and workers != 1):
+      raise Exception('Wrong input: a ray sink needs workers=1')
+    if(sink is not None):
+      names = ['source'] + [comp.name for comp in self.components]
+      if(sink.names != names):
+        raise Exception('Wrong input: ray sink of stages {:} cannot store beamline {:} stages {:}'.format(sink.names, self.name, names))
+      if(sink.n < n):
+        raise Exception('Wrong input: ray sink holds {:d} rays, {:d} requested'.format(sink.n, n))
+    if(cache is not None and (seed is None or sink is not None)):
+      cache = None
+    if(not isinstance(seed, np.random.SeedSequence)):
+      seed = np.random.SeedSequence(seed)
+    if(cache is not None):
+      key = cache.key(self, n, chunk, seed, tally.bins, sampler)
+      result = cache.get(key)
+      if(result is not None):
+        return tally.merge(result)
+
+    nchunk = -(-n // chunk)
+    sizes = [min(chunk, n - i * chunk) for i in range(nchunk)]
+    seeds = seed.spawn(nchunk)
+    result = Tally(self.components, tally.bins)
+    if(workers == 1):
+      for i, (m, ss) in enumerate(zip(sizes, seeds)):
+        result.merge(_streamChunk(self, m, ss, tally.bins, sampler, sink, i * chunk))
+      if(sink is not None):
+        sink.flush()
+    else:
+      depth = 2 * (workers or os.cpu_count() or 1)   # chunks in flight
+      with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_poolChunk, self, m, ss, tally.bins, sampler)
+                   for m, ss in zip(sizes[:depth], seeds[:depth])]
+        submitted = len(futures)
+        while(futures):   # merge in chunk order
+          chunk_tally, profiler = futures.pop(0).result()
+          result.merge(chunk_tally)
+          if(profiler is not None):
+            self.profiler.merge(profiler)
+          if(submitted < nchunk):
+            futures.append(pool.submit(_poolChunk, self, sizes[submitted], seeds[submitted], tally.bins, sampler))
+            submitted += 1
+    if(cache is not None):
+      cache.put(key, result)
+    return tally.merge(result)
+
+  def converge(self, rtol=0.01, atol=0., batch=100000, seed=None, tally=None, workers=1,
+               sampler=None, min_batches=10, max_rays=100000000, z=1.96):
+    """ Trace batches of source rays until every tallied fraction is known to a relative
+        standard error rtol (or absolute atol), and return its confidence interval
+        Each batch is an independent replicate, so the standard error of a fraction is the
+        batch-to-batch spread over sqrt(batches); this holds for the quasi-random samplers too.
+        Batches draw from successive SeedSequence.spawn streams and the stopping rule is
+        checked in batch order, so the result for a given seed does not depend on workers.
+        Return (tally, intervals, converged) with intervals a dict of quantity name
+        ('transmitted' and each component, as in Tally.fractions) to dict of
+        value, error (standard error), low, high (value -/+ z * error).
+        rtol: target relative standard error of every fraction
+        atol: absolute standard error accepted for small fractions
+        batch: rays per batch
+        seed: int or numpy.random.SeedSequence (fresh entropy if None)
+        tally: Tally to accumulate into (a new one if None)
+        workers: number of processes (1 runs in this process; None uses all cores)
+        sampler: Sampler of the source and jitter samples (pseudo-random if None);
+                 batch is rounded down to its chunkSize
+        min_batches: batches traced before the first convergence check
+        max_rays: stop at this number of rays even if not converged
+        z: half width of the confidence intervals in standard errors (1.96 for 95%)
+    """
+    if(tally is None):
+      tally = Tally(self.components)
+    if(sampler is not None):
+      batch = sampler.chunkSize(batch)
+    if(not isinstance(seed, np.random.SeedSequence)):
+      seed = np.random.SeedSequence(seed)
+    min_batches = max(min_batches, 2)
+    max_batches = max(-(-max_rays // batch), min_batches)
+    result = Tally(self.components, tally.bins)
+    fracs = []
+    converged = False
+
+    def check(chunk_tally):
+      result.merge(chunk_tally)
+      fracs.append(list(chunk_tally.fractions().values()))
+      if(len(fracs) < min_batches):
+        return False
+      value, error = _batchError(fracs)
+      return bool(np.all(error <= np.maximum(rtol * np.abs(value), atol)))
+
+    if(workers == 1):
+      for i in range(max_batches):
+        if(check(_streamChunk(self, batch, seed.spawn(1)[0], tally.bins, sampler))):
+          converged = True
+          break
+    else:
+      depth = 2 * (workers or os.cpu_count() or 1)   # batches in flight
+      with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_poolChunk, self, batch, ss, tally.bins, sampler)
+                   for ss in seed.spawn(min(depth, max_batches))]
+        submitted = len(futures)
+        while(futures):
+          chunk_tally, profiler = futures.pop(0).result()
+          if(profiler is not None):
+            self.profiler.merge(profiler)
+          if(check(chunk_tally)):
+            converged = True
+            break
+          if(submitted < max_batches):
+            futures.append(pool.submit(_poolChunk, self, batch, seed.spawn(1)[0], tally.bins, sampler))
+            submitted += 1
+        for f in futures:
+          f.cancel()
+
+    value, error = _batchError(fracs)
+    intervals = {}
+    for name, v, e in zip(result.fractions(), value, error):
+      intervals[name] = {'value': float(v), 'error': float(e),
+                         'low': float(v - z * e), 'high': float(v + z * e)}
+    return tally.merge(result), intervals, converged
+
+
+def _streamChunk(beamline, n, seed, bins, sampler=None, sink=None, start=0):
+  """ Tally of one chunk of n rays traced with its own random stream
+      sink: RayStore receiving the stages, written from source ray number start
+  """
+  tally = Tally(beamline.components, bins)
+  stages = beamline.run(n, np.random.default_rng(seed), tally, sampler)
+  if(sink is not None):
+    sink.write(start, stages)
+  return tally
+
+
+def _poolChunk(beamline, n, seed, bins, sampler=None):
+  """ Tally and profiler records of one chunk traced in a worker process
+  """
+  return _streamChunk(beamline, n, seed, bins, sampler), beamline.profiler
+
+
+def _batchError(fracs):
+  """ Mean and standard error of the mean of (batches, quantities) batch fractions
+  """
+  fracs = np.asarray(fracs, dtype=np.float64)
+  if(fracs.shape[0] < 2):
+    return fracs.mean(axis=0), np.full(fracs.shape[1], np.inf)
+  return fracs.mean(axis=0), fracs.std(axis=0, ddof=1) / np.sqrt(fracs.shape[0])
+
+
+def paramKey(comp):
+  """ Hash of the parameters of a component, from its getParams()
+  """
+  h = hashlib.sha1(type(comp).__name__.encode())
+  for name, value in sorted(comp.getParams().items()):
+    value = np.asarray(value)
+    h.update(name.encode())
+    h.update(str(value.dtype).encode() + str(value.shape).encode())
+    h.update(value.tobytes())
+  return h.hexdigest()
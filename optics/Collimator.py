@@ -1,7 +1,7 @@
 import numpy as np
-from matplotlib.collections import LineCollection
 
-import geometry as g
+from . import geometry as g
+from .RayBundle import RayBundle
 
 class Collimator():
   """ Class of donut-shape collimator pependicular to nominal direction
@@ -9,6 +9,8 @@ class Collimator():
   _nA = 20       # number of angular bins
   _cl = 'red'    # color on drawing
   _lw = 2        # linewidth on drawing
+  _flag = 'absorbed'  # what the transport mask flags
+  _ndim = 0      # number of random samples per ray
   def __init__(self, name, location, innerD, outterD):
     """
     name: string of name
@@ -20,6 +22,12 @@ class Collimator():
     self.iR  = innerD * 0.5
     self.oR  = outterD * 0.5
     self.norm = np.array([0., 0., 1.], dtype=np.float32)
+    self._initFrame()
+
+  def getParams(self):
+    """ Parameters defining the transport, as a dict
+    """
+    return {'name': self.name, 'loc': self.loc, 'norm': self.norm, 'iR': self.iR, 'oR': self.oR}
 
   def setXYfromMirror(self, mirror):
     """ Calculate X & Y coordinates from the reflection of a mirror
@@ -27,25 +35,45 @@ class Collimator():
     self.loc[0] = mirror.loc[0] + mirror.out[0] / mirror.out[2] * (self.loc[2] - mirror.loc[2])
     self.loc[1] = mirror.loc[1] + mirror.out[1] / mirror.out[2] * (self.loc[2] - mirror.loc[2])
     self.norm = mirror.out
+    self._initFrame()
+
+  def _initFrame(self):
+    # local x/y directions on the collimator face
+    self._ex = g.VectorNormalize(g.AxisX - self.norm[0] * self.norm)
+    self._ey = np.cross(self.norm, self._ex)
 
   def drawZX(self):
     """ Draw component on the Z-X plane (horizontal)
+        The drawing layer (and matplotlib) is imported only when drawing.
+    """
+    from .drawing import collimatorZX
+    return collimatorZX(self)
+
+  def footprintRange(self):
+    """ Footprint range [[xmin,xmax],[ymin,ymax]] on the collimator face
+    """
+    return [[-self.oR, self.oR], [-self.oR, self.oR]]
+
+  def footprint(self, points):
+    """ Local (x,y) coordinates (N,2) of points (N,3) on the collimator face
+    """
+    v = points - self.loc
+    return np.stack([v.dot(self._ex), v.dot(self._ey)], axis=1)
+
+  def transport(self, ray, rng=None, tally=None, samples=None):
+    """ Transport a ray (2,3), a ray bundle (N,2,3) or a RayBundle
+        A single ray returns the output ray (2,3), with zero length if absorbed.
+        A bundle returns the surviving rays (M,2,3) and the (N,) mask of rays absorbed here.
+        A RayBundle is transported in place, absorbed rays cleared from its alive mask,
+        and returned with the (N,) mask of rays absorbed here.
+        rng, samples: not used, kept for the common component interface
+        tally: Tally filled in place by a bundle transport
     """
-    rot = g.rot2D(self.norm[0])
-    p0 = np.array([self.loc[2], self.loc[0]])
-    v1 = rot.dot([0., self.iR])
-    v2 = rot.dot([0., self.oR])
-    segs = np.array([ [p0+v1, p0+v2],
-                      [p0-v1, p0-v2]], dtype=np.float32)
-    ls = LineCollection(segs, linewidths=self._lw, colors=self._cl)
-
-    # update draw region
-    self.draw_min = np.array([segs[:,:,1].min(), segs[:,:,0].min()])
-    self.draw_max = np.array([segs[:,:,1].max(), segs[:,:,0].max()])
-
-    return ls
-  
-  def transport(self, ray):
+    if(isinstance(ray, RayBundle)):
+      return self._transportRayBundle(ray, tally)
+    if(len(ray.shape) == 3):
+      return self._transportBundle(ray, tally)
+
     v0 = self.loc
     n = self.norm
     p0 = ray[0]
@@ -65,4 +93,59 @@ class Collimator():
       output_ray = np.array([ps, ps + u])
     return output_ray
 
- 
\ No newline at end of file
+  def _transportBundle(self, rays, tally=None):
+    """ Transport a ray bundle (N,2,3); absorbed rays are removed from the output
+    """
+    p0 = rays[:,0]
+    u = g.VectorNormalize(rays[:,1] - p0)
+    ps = g.PlaneIntersection(p0, u, self.loc, self.norm)
+
+    L = np.linalg.norm(ps - self.loc, axis=1)
+    absorbed = (self.iR <= L) & (L <= self.oR)
+    if(tally is not None):
+      tally.fill(self.name, self.footprint(ps), absorbed)
+
+    alive = ~absorbed
+    output_rays = np.empty((np.count_nonzero(alive), 2, 3))
+    output_rays[:,0] = ps[alive]
+    output_rays[:,1] = output_rays[:,0] + u[alive]
+    return output_rays, absorbed
+
+  def _transportRayBundle(self, bundle, tally=None):
+    """ Transport a RayBundle in place; absorbed rays are cleared from bundle.alive
+    """
+    dt = bundle.dtype
+    loc = self.loc.astype(dt)
+    n = self.norm.astype(dt)
+    p = bundle.origin
+    u = bundle.direction
+    s = (loc - p).dot(n) / u.dot(n)
+    p += s[:,np.newaxis] * u
+
+    L = np.linalg.norm(p - loc, axis=1)
+    absorbed = (self.iR <= L) & (L <= self.oR)
+    absorbed &= bundle.alive
+    if(tally is not None):
+      tally.fill(self.name, self.footprint(p[bundle.alive]), absorbed[bundle.alive])
+    bundle.alive &= ~absorbed
+    return bundle, absorbed
+
+  def tangent(self, rays, jac, samples=None, col=None):
+    """ Derivatives of the plane intersection of a bundle w.r.t. the beamline parameters
+        rays: (N,2,3) incoming rays
+        jac: (N,P,2,3) derivatives of the incoming ray point and unit direction w.r.t. P parameters
+        samples, col: not used, kept for the common component interface
+        Return (N,P,2,3) derivatives of the ray point on the collimator plane and unit direction,
+        for all incoming rays (absorbed ones included).
+    """
+    p0 = rays[:,0]
+    u = g.VectorNormalize(rays[:,1] - p0)
+    un = u.dot(self.norm)
+    s = (self.loc - p0).dot(self.norm) / un
+    dp = jac[:,:,0]
+    du = jac[:,:,1]
+    ds = -(dp.dot(self.norm) + s[:,np.newaxis] * du.dot(self.norm)) / un[:,np.newaxis]
+    out = np.empty_like(jac)
+    out[:,:,0] = dp + ds[:,:,np.newaxis] * u[:,np.newaxis] + s[:,np.newaxis,np.newaxis] * du
+    out[:,:,1] = du
+    return out
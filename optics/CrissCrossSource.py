@@ -1,11 +1,12 @@
 import numpy as np
-from matplotlib.collections import LineCollection
 
-import geometry as g
+from . import geometry as g
+from .RayBundle import RayBundle
 
 class CrissCrossSource():
   _cl = 'black'  # color on drawing
   _lw = 2        # linewidth on drawing
+  _ndim = 4      # number of random samples per ray
   def __init__(self, location1, location2, size1, size2):
     """
     location: (x,y,z) of component
@@ -17,35 +18,103 @@ class CrissCrossSource():
     self.size1 = size1
     self.size2 = size2
 
-  def getOneRay(self):
+  def getParams(self):
+    """ Parameters defining the generated rays, as a dict
+    """
+    return {'loc1': self.loc1, 'loc2': self.loc2, 'size1': self.size1, 'size2': self.size2}
+
+  def getOneRay(self, rng=None):
+    """ Generate one ray (2,3)
+        rng: numpy.random.Generator (the global numpy.random state if None)
+    """
+    rand = np.random.rand if(rng is None) else rng.random
     # upstream point
-    theta1 = 2 * np.pi * np.random.rand()
-    radius1 = np.sqrt(np.random.rand()) * self.size1 / 2
+    theta1 = 2 * np.pi * rand()
+    radius1 = np.sqrt(rand()) * self.size1 / 2
     x1 = radius1 * np.cos(theta1) + self.loc1[0]
     y1 = radius1 * np.sin(theta1) + self.loc1[1]
     z1 = self.loc1[2]
 
     # downstream point
-    theta2 =  2 * np.pi * np.random.rand()
-    radius2 = np.sqrt(np.random.rand()) * self.size2 / 2
+    theta2 =  2 * np.pi * rand()
+    radius2 = np.sqrt(rand()) * self.size2 / 2
     x2 = radius2 * np.cos(theta2) + self.loc2[0]
     y2 = radius2 * np.sin(theta2) + self.loc2[1]
     z2 = self.loc2[2]
 
     return np.array([[x1, y1, z1], [x2, y2, z2]])
 
+  def getRays(self, n, rng=None, samples=None):
+    """ Generate n rays at once, returned as a (n,2,3) array
+        rng: numpy.random.Generator for reproducible runs (a new one if None)
+        samples: (n,4) samples in [0,1) to use instead of rng, e.g. from a Sampler
+                 (angle and radius on the upstream disk, then on the downstream disk)
+    """
+    if(samples is None):
+      if(rng is None):
+        rng = np.random.default_rng()
+      samples = rng.random((n, 4))
+
+    rays = np.empty((n, 2, 3))
+    # upstream points
+    theta1 = 2 * np.pi * samples[:,0]
+    radius1 = np.sqrt(samples[:,1]) * self.size1 / 2
+    rays[:,0,0] = radius1 * np.cos(theta1) + self.loc1[0]
+    rays[:,0,1] = radius1 * np.sin(theta1) + self.loc1[1]
+    rays[:,0,2] = self.loc1[2]
+
+    # downstream points
+    theta2 = 2 * np.pi * samples[:,2]
+    radius2 = np.sqrt(samples[:,3]) * self.size2 / 2
+    rays[:,1,0] = radius2 * np.cos(theta2) + self.loc2[0]
+    rays[:,1,1] = radius2 * np.sin(theta2) + self.loc2[1]
+    rays[:,1,2] = self.loc2[2]
+    return rays
+
+  def getBundle(self, n, rng=None, samples=None, dtype=np.float32):
+    """ Generate n rays at once as a RayBundle of the given dtype, as getRays
+    """
+    return RayBundle.fromRays(self.getRays(n, rng, samples), dtype)
+
+  def rimSamples(self, n, shrink=1e-9):
+    """ (n*n,4) getRays samples pairing each of n points on the upstream disk rim
+        with each of n points on the downstream disk rim
+        shrink: relative distance of the rim points inside the disks, so that rays
+                grazing an aperture equal to a disk are not lost to rounding
+    """
+    theta = np.arange(n) / n
+    samples = np.full((n * n, 4), (1. - shrink)**2)
+    samples[:,0] = np.repeat(theta, n)
+    samples[:,2] = np.tile(theta, n)
+    return samples
+
+  def chordSamples(self, n, j, t, shrink=1e-9):
+    """ (k,4) getRays samples of rays from a rim point of one disk to a point on a
+        diameter of the other, for 2*n*n chords numbered j in [0, 2*n*n)
+        j // (n*n): 0 upstream rim to downstream diameter, 1 downstream rim to upstream diameter
+        (j // n) % n: rim point at angle 2*pi*i/n; j % n: diameter at angle pi*d/n
+        j: (k,) chord numbers; t: (k,) position along the diameter in [-1,1]
+        shrink: relative distance of the rim points inside the disks, as in rimSamples
+    """
+    j = np.asarray(j)
+    t = np.asarray(t, dtype=np.float64)
+    rim = ((j // n) % n) / n
+    diameter = (j % n) / (2. * n) + 0.5 * (t < 0)
+    upstream = j < n * n
+    edge = (1. - shrink)**2
+    samples = np.empty((j.shape[0], 4))
+    samples[:,0] = np.where(upstream, rim, diameter)
+    samples[:,1] = np.where(upstream, edge, t**2)
+    samples[:,2] = np.where(upstream, diameter, rim)
+    samples[:,3] = np.where(upstream, t**2, edge)
+    return samples
 
   def drawZX(self):
     """ Draw component on the Z-X plane (horizontal)
+        The drawing layer (and matplotlib) is imported only when drawing.
     """
-    p1 = [self.loc1[2], self.loc1[0] + self.size1 / 2]
-    p2 = [self.loc1[2], self.loc1[0] - self.size1 / 2]
-    segs = np.array([[p1,p2]])
-    ls = LineCollection(segs, linewidths = 2, colors = 'black')
-    
-    self.draw_min = np.array([segs[:,:,1].min(), segs[:,:,0].min()])
-    self.draw_max = np.array([segs[:,:,1].max(), segs[:,:,0].max()])
-    return ls
+    from .drawing import crissCrossSourceZX
+    return crissCrossSourceZX(self)
 
   def transport(self, ray):
     pass
\ No newline at end of file
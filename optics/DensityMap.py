@@ -0,0 +1,178 @@
+import numpy as np
+
+from . import geometry as g
+
+class DensityMap():
+  """
+  Class of a 2D intensity grid of traced ray paths on the Z-X or Z-Y plane
+  Segment ends are snapped to the grid cells, and identical snapped segments are
+  accumulated with a count as the chunks are traced. The grid is rasterized from the
+  distinct segments only, so its cost is set by the beam geometry and the binning,
+  not by the number of rays.
+  Properties:
+  * plane: 'x' for the Z-X plane (horizontal) or 'y' for the Z-Y plane (vertical)
+  * zrange, trange: (2,) range of Z and of the transverse X or Y
+  * bins: (nz, nt) number of bins along Z and the transverse axis
+  * grid: (nz, nt) number of rays crossing each Z column, binned transversely
+  """
+  def __init__(self, zrange, trange, bins=(800, 400), plane='x'):
+    """
+    zrange: (zmin, zmax) range along the beam
+    trange: (min, max) transverse range
+    bins: (nz, nt) number of bins
+    plane: 'x' or 'X' for Z-X; 'y' or 'Y' for Z-Y
+    """
+    if(plane == 'x' or plane == 'X'):
+      self.plane = 'x'
+      self._axis = 0
+    elif(plane == 'y' or plane == 'Y'):
+      self.plane = 'y'
+      self._axis = 1
+    else:
+      raise Exception('Wrong plane {:}.  Must be X or Y'.format(plane))
+    self.zrange = np.array(zrange, dtype=np.float64)
+    self.trange = np.array(trange, dtype=np.float64)
+    self.bins = tuple(bins)
+    self._keys = np.zeros(0, dtype=np.int64)     # distinct snapped segments
+    self._counts = np.zeros(0, dtype=np.int64)   # number of rays on each
+    self._grid = None
+
+  def fill(self, beamline, stages):
+    """ Add all ray segments of traced stages from Beamline.trace
+        Rays removed by a component end on its nominal plane;
+        rays leaving the last component are extended to the end of the map.
+    """
+    keys = []
+    for comp, prev, stage in zip(beamline.components, stages[:-1], stages[1:]):
+      p0 = prev.rays[:,0]
+      p1 = np.empty_like(p0)
+      if(stage.rays.shape[0] < p0.shape[0]):
+        gone = stage.mask
+        p1[~gone] = stage.rays[:,0]
+        p1[gone] = g.PlaneIntersection(p0[gone], prev.rays[gone,1] - p0[gone], comp.loc, comp.norm)
+      else:
+        p1[:] = stage.rays[:,0]
+      keys.append(self._segmentKeys(p0, p1))
+
+    last = stages[-1].rays
+    u = last[:,1] - last[:,0]
+    s = (self.zrange[1] - last[:,0,2]) / u[:,2]
+    keys.append(self._segmentKeys(last[:,0], last[:,0] + s[:,np.newaxis] * u))
+
+    keys = np.concatenate(keys)
+    self._add(keys, np.ones_like(keys))
+
+  def _segmentKeys(self, p0, p1):
+    """ Segments (M,3) -> (M,3) clipped to the Z range and snapped to the grid, as int64 keys
+        Key = ((c0 * nt3 + ia) * (nz + 1) + c1) * nt3 + ib, with columns c0, c1 and transverse bins ia, ib
+        (offset by nt to keep segments leaving the transverse range).
+    """
+    nz, nt = self.bins
+    z0 = p0[:,2]
+    z1 = p1[:,2]
+    t0 = p0[:,self._axis]
+    t1 = p1[:,self._axis]
+    dz = z1 - z0
+    dz[dz == 0.] = np.inf
+    slope = (t1 - t0) / dz
+    zc0 = np.clip(np.minimum(z0, z1), self.zrange[0], self.zrange[1])
+    zc1 = np.clip(np.maximum(z0, z1), self.zrange[0], self.zrange[1])
+    keep = zc1 > zc0
+
+    bz = (self.zrange[1] - self.zrange[0]) / nz
+    bt = (self.trange[1] - self.trange[0]) / nt
+    c0 = np.rint((zc0[keep] - self.zrange[0]) / bz).astype(np.int64)
+    c1 = np.rint((zc1[keep] - self.zrange[0]) / bz).astype(np.int64)
+    ta = t0[keep] + (zc0[keep] - z0[keep]) * slope[keep]
+    tb = t0[keep] + (zc1[keep] - z0[keep]) * slope[keep]
+    nt3 = 3 * nt
+    ia = np.clip(np.floor((ta - self.trange[0]) / bt).astype(np.int64) + nt, 0, nt3 - 1)
+    ib = np.clip(np.floor((tb - self.trange[0]) / bt).astype(np.int64) + nt, 0, nt3 - 1)
+    return ((c0 * nt3 + ia) * (nz + 1) + c1) * nt3 + ib
+
+  def _add(self, keys, counts):
+    """ Merge snapped segment keys with their counts
+    """
+    keys, inverse = np.unique(np.concatenate([self._keys, keys]), return_inverse=True)
+    self._counts = np.bincount(inverse, weights=np.concatenate([self._counts, counts]),
+                               minlength=keys.shape[0]).astype(np.int64)
+    self._keys = keys
+    self._grid = None
+
+  @property
+  def grid(self):
+    if(self._grid is None):
+      self._grid = self._rasterize()
+    return self._grid
+
+  def _rasterize(self):
+    """ Draw the distinct snapped segments into the grid, one bin per Z column
+    """
+    nz, nt = self.bins
+    nt3 = 3 * nt
+    ib = self._keys % nt3
+    rest = self._keys // nt3
+    c1 = rest % (nz + 1)
+    rest = rest // (nz + 1)
+    ia = rest % nt3
+    c0 = rest // nt3
+
+    # expand every segment to its columns c0 <= c < c1
+    length = c1 - c0
+    seg = np.repeat(np.arange(self._keys.shape[0]), length)
+    col = np.arange(seg.shape[0]) - np.repeat(np.cumsum(length) - length, length)
+    frac = (col + 0.5) / length[seg]
+    it = np.floor(ia[seg] + 0.5 + (ib[seg] - ia[seg]) * frac).astype(np.int64) - nt
+    col += c0[seg]
+    inside = (it >= 0) & (it < nt)
+    idx = col[inside] * nt + it[inside]
+    grid = np.bincount(idx, weights=self._counts[seg[inside]], minlength=nz * nt)
+    return grid.astype(np.int64).reshape(self.bins)
+
+  def trace(self, beamline, n, chunk=100000, seed=None):
+    """ Trace n source rays chunk by chunk into the map, with the chunk streams of Beamline.stream
+    """
+    if(not isinstance(seed, np.random.SeedSequence)):
+      seed = np.random.SeedSequence(seed)
+    nchunk = -(-n // chunk)
+    for i, ss in enumerate(seed.spawn(nchunk)):
+      self.fill(beamline, beamline.run(min(chunk, n - i * chunk), np.random.default_rng(ss)))
+    return self
+
+  def merge(self, other):
+    """ Add the grid of another DensityMap with the same binning
+    """
+    if(self.plane != other.plane or self.bins != other.bins
+       or not np.array_equal(self.zrange, other.zrange) or not np.array_equal(self.trange, other.trange)):
+      raise Exception('Wrong input: density maps must have the same plane and binning')
+    self._add(other._keys, other._counts)
+    return self
+
+  def save(self, path, comp_list=(), title=None, figsize=(10,5), dpi=150):
+    """ Render the map to an image file (e.g. PNG) without a display
+        comp_list: components whose drawZX outlines are overlaid (Z-X plane only)
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.colors import LogNorm
+
+    fig = Figure(figsize=figsize, dpi=dpi, facecolor='white')
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    grid = self.grid
+    norm = LogNorm(vmin=1, vmax=grid.max()) if(grid.max() > 1) else None
+    im = ax.imshow(np.ma.masked_equal(grid.T, 0), origin='lower', aspect='auto',
+                   extent=(self.zrange[0], self.zrange[1], self.trange[0], self.trange[1]),
+                   norm=norm, cmap='viridis', interpolation='nearest')
+    fig.colorbar(im, ax=ax, label='ray crossings')
+    if(self.plane == 'x'):
+      for comp in comp_list:
+        ax.add_collection(comp.drawZX())
+    ax.set_xlim(self.zrange)
+    ax.set_ylim(self.trange)
+    ax.set_xlabel('Z')
+    ax.set_ylabel(self.plane.upper())
+    if(title is not None):
+      ax.set_title(title)
+    fig.tight_layout()
+    fig.savefig(path)
@@ -1,7 +1,7 @@
 import numpy as np
-from matplotlib.collections import LineCollection
 
-import geometry as g
+from . import geometry as g
+from .RayBundle import RayBundle
 
 class FlatMirror():
   """
@@ -14,11 +14,12 @@ class FlatMirror():
   * horizontal: bool, horizontal or vertical if not
   * sign: +/-1 to indicate the mirror orientation
   * norm: norm vector at nominal; inp: incident norm vector; out: output norm vector
-  * refl: (ndA * ntrans, 6) reflection surfaces, each plain is defined as point (3,) and norm (3,)
-  * front: (ndA * ntrans, 6) front surfaces, each plain is defined as point (3,) and norm (3,)
+  * refl: (ndA * ntrans, 6) float64 reflection surfaces, each plain is defined as point (3,) and norm (3,)
   """
   _cl = 'red'  # color on drawing
   _lw = 1      # linewidth on drawing
+  _flag = 'hit'  # what the transport mask flags
+  _ndim = 2      # number of random samples per ray (translation, rotation)
   def __init__(self, name, location, size, direction, A, deltaA, translation, incidentNorm, ndA=11, ntrans=5):
     """
     Parmaeters:
@@ -55,6 +56,13 @@ class FlatMirror():
     self._initSurfaces()
 
 
+  def getParams(self):
+    """ Parameters defining the transport, as a dict
+    """
+    return {'name': self.name, 'loc': self.loc, 'half_size': self.half_size, 'A': self.A,
+            'norm': self.norm, 'dA': self.dA, 'trans': self.trans, 'sign': self.sign,
+            'horizontal': self.horizontal, 'ndA': self.ndA, 'ntrans': self.ntrans}
+
   def setA(self, newA):
     self.A = newA
     if(self.horizontal):
@@ -62,67 +70,64 @@ class FlatMirror():
     else:
       self.norm = np.array([0., np.cos(self.A)*self.sign, -np.abs(np.sin(self.A))], dtype=np.float32)
     self.out = g.Reflection(self.inp, self.norm)
+    self._initSurfaces()
 
 
   def _initSurfaces(self):
-    # initialize mirror reflection and front surfaces on each dvision
-    self.refl = np.zeros((self.ndA*self.ntrans, 6), dtype=np.float32)
-    self.front = np.zeros_like(self.refl)
-    for iA in range(self.ndA):
-      A = self.A + self.dA[0] + (self.dA[1] - self.dA[0]) * iA / (self.ndA - 1)
-      for iX in range(self.ntrans):
-        trans = self.trans[0] + (self.trans[1] - self.trans[0]) * iX / (self.ntrans - 1)
+    # initialize mirror reflection surfaces on each dvision, in float64 as transport
+    # row iA * ntrans + iX: rotation dA[iA] and translation trans[iX], as applied in transport
+    self.refl = np.zeros((self.ndA*self.ntrans, 6))
+    # nominal length and width directions of the mirror surface
+    self._length = g.VectorNormalize(g.AxisZ - self.norm[2] * self.norm)
+    self._width = np.cross(self.norm, self._length)
+    dA = (self.dA[1] - self.dA[0]) * (np.arange(self.ndA) / (self.ndA - 1)) + self.dA[0]
+    trans = (self.trans[1] - self.trans[0]) * (np.arange(self.ntrans) / (self.ntrans - 1)) + self.trans[0]
+    self.refl[:,:3] = self.loc
+    self.refl[:,0] += np.tile(trans, self.ndA)
+    self.refl[:,3:] = np.repeat(g.Rotate(self.norm.astype(np.float64), g.AxisY, dA), self.ntrans, axis=0)
 
   def setXYfromMirror(self, mirror):
     pass
     
   def drawZX(self):
     """ Draw component on the Z-X plane (horizontal)
+        The drawing layer (and matplotlib) is imported only when drawing.
     """
-    if(self.horizontal):  # horizontal reflection
-      # mirror body
-      rot = g.rot2D(self.A)
-      p0 = np.array([self.loc[2], self.loc[0]])
-      v1 = rot.dot([self.half_size[2], 0.])
-      v2 = rot.dot([0., -self.sign * self.half_size[0]])
-      mirror_segs = np.array([p0+v1, p0-v1, p0-v1+v2, p0+v1+v2, p0+v1], dtype=np.float32)
-      self.draw_min = np.array([mirror_segs[:,1].min(),
-                                mirror_segs[:,0].min()],
-                              dtype=np.float32)
-      self.draw_max = np.array([mirror_segs[:,1].max(),
-                                mirror_segs[:,0].max()],
-                              dtype=np.float32)
-
-      # mirror motion range
-      #  ** this part needs to be fixed to take +/- dA **
-      dz  = self.half_size[2] * np.cos(self.A - self.dA[1])
-      dx1 = self.half_size[2] * np.sin(np.abs(self.A) + self.dA[1])
-      dx2 = self.half_size[2] * np.sin(np.abs(self.A) - self.dA[1])
-      range_segs = np.array([
-                      (self.loc[2] + dz,
-                       self.loc[0] + (self.trans[0] + dx1) * self.sign),
-                      (self.loc[2] - dz,
-                       self.loc[0] + (self.trans[0] - dx2) * self.sign),
-                      (self.loc[2] - dz,
-                       self.loc[0] - (self.trans[1] + dx1) * self.sign),
-                      (self.loc[2] + dz,
-                       self.loc[0] - (self.trans[1] - dx2) * self.sign),
-                      (self.loc[2] + dz,
-                       self.loc[0] + (self.trans[0] + dx1) * self.sign)],
-                    dtype=np.float32)
-      ls = LineCollection([mirror_segs, range_segs], linewidths=self._lw,
-                  linestyles='solid', colors=['gray', self._cl])
-    
-    else: # vertical reflection, draw dashed rectangle only
-      pass
-    
-    return ls
+    from .drawing import flatMirrorZX
+    return flatMirrorZX(self)
+
+  def footprintRange(self):
+    """ Footprint range [[lmin,lmax],[wmin,wmax]] along the mirror length and width
+    """
+    return [[-self.half_size[2], self.half_size[2]], [-self.half_size[1], self.half_size[1]]]
 
-  def transport(self, ray):
+  def footprint(self, points):
+    """ Local (length, width) coordinates (N,2) of points (N,3) on the nominal mirror surface
+    """
+    v = points - self.loc
+    return np.stack([v.dot(self._length), v.dot(self._width)], axis=1)
+
+  def transport(self, ray, rng=None, tally=None, samples=None):
+    """ Transport a ray (2,3), a ray bundle (N,2,3) or a RayBundle
+        A single ray returns the output ray (2,3).
+        A bundle returns the output rays (N,2,3) and the (N,) mask of rays hitting the mirror.
+        A RayBundle is transported in place and returned with the (N,) mask of alive rays
+        hitting the mirror.
+        rng: numpy.random.Generator for the jitter
+             (a new one for a bundle, the global numpy.random state for a single ray if None)
+        tally: Tally filled in place by a bundle transport
+        samples: (N,2) samples in [0,1) for the bundle translation and rotation jitter, instead of rng
+    """
+    if(isinstance(ray, RayBundle)):
+      return self._transportRayBundle(ray, rng, tally, samples)
+    if(len(ray.shape) == 3):
+      return self._transportBundle(ray, rng, tally, samples)
+
+    random = np.random.random if(rng is None) else rng.random
     v0 = np.copy(self.loc)
     n = np.copy(self.norm)
-    v0[0] += (self.trans[1] - self.trans[0]) * np.random.random() + self.trans[0] 
-    dA = (self.dA[1] - self.dA[0]) * np.random.random() + self.dA[0]
+    v0[0] += (self.trans[1] - self.trans[0]) * random() + self.trans[0] 
+    dA = (self.dA[1] - self.dA[0]) * random() + self.dA[0]
     n = g.Ry(dA).dot(n)
 
     p0 = ray[0]
@@ -144,4 +149,115 @@ class FlatMirror():
       output_ray = np.array([ps, ps + refl_u * 0.1])
     else:
       output_ray = np.array([ps, ps + u])
-    return output_ray
\ No newline at end of file
+    return output_ray
+
+  def _intersect(self, p0, u, samples, dtype=np.float64):
+    """ Intersection of rays from points p0 (N,3) along unit directions u (N,3) with the mirror
+        jittered by samples (N,2), computed in the float dtype given
+        Return the rotated norms n, ray point to mirror center w, u.n, distance s along u,
+        intersection points ps, and the mask of rays hitting the mirror.
+    """
+    dx = ((self.trans[1] - self.trans[0]) * samples[:,0] + self.trans[0]).astype(dtype)
+    dA = (self.dA[1] - self.dA[0]) * samples[:,1] + self.dA[0]
+    n = g.Rotate(self.norm.astype(dtype), g.AxisY, dA)
+
+    w = self.loc.astype(dtype) - p0
+    w[:,0] += dx
+    un = np.einsum('ij, ij->i', n, u)
+    s = np.einsum('ij, ij->i', n, w) / un
+    ps = p0 + s[:,np.newaxis] * u
+    hit = np.abs(ps[:,2] - self.loc[2]) <= self.half_size[2] * np.abs(n[:,0])
+    return n, w, un, s, ps, hit
+
+  def _transportBundle(self, rays, rng=None, tally=None, samples=None):
+    """ Transport a ray bundle (N,2,3) with per-ray rotation and translation jitter
+    """
+    nr = rays.shape[0]
+    if(samples is None):
+      if(rng is None):
+        rng = np.random.default_rng()
+      samples = np.stack([rng.random(nr), rng.random(nr)], axis=1)
+    u = g.VectorNormalize(rays[:,1] - rays[:,0])
+    n, w, un, s, ps, hit = self._intersect(rays[:,0], u, samples)
+    if(tally is not None):
+      tally.fill(self.name, self.footprint(ps), hit)
+
+    output_rays = np.empty((nr, 2, 3))
+    output_rays[:,0] = ps
+    output_rays[:,1] = ps + u
+    output_rays[hit,1] = ps[hit] + g.Reflection(u[hit], n[hit]) * 0.1
+    return output_rays, hit
+
+  def _transportRayBundle(self, bundle, rng=None, tally=None, samples=None):
+    """ Transport a RayBundle in place with per-ray rotation and translation jitter
+    """
+    nr = len(bundle)
+    if(samples is None):
+      if(rng is None):
+        rng = np.random.default_rng()
+      samples = np.stack([rng.random(nr), rng.random(nr)], axis=1)
+    u = bundle.direction
+    n, w, un, s, ps, hit = self._intersect(bundle.origin, u, samples, bundle.dtype)
+    bundle.origin[:] = ps
+    hit &= bundle.alive
+    if(tally is not None):
+      tally.fill(self.name, self.footprint(ps[bundle.alive]), hit[bundle.alive])
+    # reflection as in geometry.Reflection, on the hit rays only
+    u[hit] -= 2. * un[hit,np.newaxis] * n[hit]
+    return bundle, hit
+
+  def tangent(self, rays, jac, samples, col):
+    """ Derivatives of the output rays of a bundle transport w.r.t. the beamline parameters
+        rays: (N,2,3) incoming rays; samples: (N,2) translation and rotation samples of transport
+        jac: (N,P,2,3) derivatives of the incoming ray point and unit direction w.r.t. P parameters
+        col: parameter index of this mirror translation (col) and rotation angle (col+1)
+        Return (N,P,2,3) derivatives of the output ray point (the mirror plane intersection)
+        and unit direction, from the plane intersection and Reflection formulas.
+    """
+    u = g.VectorNormalize(rays[:,1] - rays[:,0])
+    n, w, un, s, ps, hit = self._intersect(rays[:,0], u, samples)
+
+    # d(norm)/d(angle): rotation along Y; d(surface point)/d(translation): X
+    dn = np.zeros(jac.shape[:2] + (3,))
+    dn[:,col+1,0] = n[:,2]
+    dn[:,col+1,2] = -n[:,0]
+    dw = -jac[:,:,0]
+    dw[:,col,0] += 1.
+    du = jac[:,:,1]
+
+    dun = np.einsum('ijk, ik->ij', dn, u) + np.einsum('ik, ijk->ij', n, du)
+    ds = (np.einsum('ijk, ik->ij', dn, w) + np.einsum('ik, ijk->ij', n, dw) - s[:,np.newaxis] * dun) / un[:,np.newaxis]
+    out = np.empty_like(jac)
+    out[:,:,0] = jac[:,:,0] + ds[:,:,np.newaxis] * u[:,np.newaxis] + s[:,np.newaxis,np.newaxis] * du
+    out[:,:,1] = du
+    # reflection u - 2 (u.n) n
+    out[hit,:,1] -= 2. * (dun[hit,:,np.newaxis] * n[hit,np.newaxis] + un[hit,np.newaxis,np.newaxis] * dn[hit])
+    return out
+
+  def sweep(self, rays, chunk=4096):
+    """ Transport a ray bundle (N,2,3) against every discrete mirror setting in refl
+        Deterministic, no jitter: the whole rotation/translation range in one evaluation.
+        Each chunk of rays is broadcast against all the surfaces, so the temporaries are
+        (ndA*ntrans,chunk) and only the outputs are (ndA*ntrans,N).
+        Return output rays (ndA*ntrans,N,2,3) and hit mask (ndA*ntrans,N),
+        ordered as the rows of refl.
+    """
+    v0 = self.refl[:,:3]
+    n = self.refl[:,3:]
+    nv0 = np.einsum('ij, ij->i', n, v0)[:,np.newaxis]
+    half_l = self.half_size[2] * np.abs(n[:,0,np.newaxis])
+    output_rays = np.empty((n.shape[0], rays.shape[0], 2, 3))
+    hit = np.empty((n.shape[0], rays.shape[0]), dtype=bool)
+    for i in range(0, rays.shape[0], chunk):
+      p0 = rays[i:i+chunk,0]
+      u = g.VectorNormalize(rays[i:i+chunk,1] - p0)
+      un = n.dot(u.T)
+      s = (nv0 - n.dot(p0.T)) / un
+      ps = p0 + s[:,:,np.newaxis] * u
+      h = np.abs(ps[:,:,2] - v0[:,2,np.newaxis]) <= half_l
+      # reflection as in geometry.Reflection, on the hit rays only
+      refl_u = u - 2. * un[:,:,np.newaxis] * n[:,np.newaxis]
+      output_rays[:,i:i+chunk,0] = ps
+      output_rays[:,i:i+chunk,1] = ps + np.where(h[:,:,np.newaxis], refl_u * 0.1, u)
+      hit[:,i:i+chunk] = h
+    return output_rays, hit
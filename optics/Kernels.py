@@ -0,0 +1,190 @@
+"""
+Fused transport kernels: source sampling and every component of a beamline in one
+loop per ray, compiled with Numba and parallel across rays when Numba is installed
+"""
+
+import math
+
+import numpy as np
+
+try:
+  import numba
+except ImportError:
+  numba = None
+
+_MIRROR = 0
+_COLLIMATOR = 1
+
+
+def available():
+  """ True if the compiled kernels can be used (Numba is installed)
+  """
+  return numba is not None
+
+
+def pack(beamline):
+  """ Beamline parameters as arrays for the kernel
+      Return src (8,): loc1, loc2, size1, size2;
+      comps (ncomp,14): kind, loc (3), norm (3), half length, translation (2), rotation (2), iR, oR;
+      axes (ncomp,2,3): footprint axes of each component (as in its footprint method)
+  """
+  source = beamline.source
+  src = np.array(list(source.loc1) + list(source.loc2) + [source.size1, source.size2], dtype=np.float64)
+  comps = np.zeros((len(beamline.components), 14))
+  axes = np.zeros((len(beamline.components), 2, 3))
+  for c, comp in enumerate(beamline.components):
+    comps[c,1:4] = comp.loc
+    comps[c,4:7] = comp.norm
+    if(comp._flag == 'hit'):
+      comps[c,0] = _MIRROR
+      comps[c,7] = comp.half_size[2]
+      comps[c,8:10] = comp.trans
+      comps[c,10:12] = comp.dA
+    else:
+      comps[c,0] = _COLLIMATOR
+      comps[c,12] = comp.iR
+      comps[c,13] = comp.oR
+    axes[c] = comp.footprint(comp.loc + np.eye(3)).T
+  return src, comps, axes
+
+
+def _traceRays(samples, src, comps, axes, lo, width, bins, origin, direction, fate, hits, cells):
+  """ Trace one ray per row of samples (source, then the jitter of each mirror)
+      Writes the last ray point and unit direction, the component absorbing each ray
+      (fate, ncomp if transmitted), the bit mask of the mirrors hit, and the footprint
+      histogram cell of each component reached (-1 if not reached or outside).
+  """
+  ncomp = comps.shape[0]
+  for i in prange(samples.shape[0]):
+    # source: upstream and downstream disk points
+    theta = 2. * math.pi * samples[i,0]
+    radius = math.sqrt(samples[i,1]) * src[6] / 2.
+    px = radius * math.cos(theta) + src[0]
+    py = radius * math.sin(theta) + src[1]
+    pz = src[2]
+    theta = 2. * math.pi * samples[i,2]
+    radius = math.sqrt(samples[i,3]) * src[7] / 2.
+    ux = radius * math.cos(theta) + src[3] - px
+    uy = radius * math.sin(theta) + src[4] - py
+    uz = src[5] - pz
+    norm = math.sqrt(ux * ux + uy * uy + uz * uz)
+    ux /= norm
+    uy /= norm
+    uz /= norm
+
+    col = 4
+    fate[i] = ncomp
+    hits[i] = 0
+    for c in range(ncomp):
+      cells[i,c] = -1
+    for c in range(ncomp):
+      if(comps[c,0] == _MIRROR):
+        dx = (comps[c,9] - comps[c,8]) * samples[i,col] + comps[c,8]
+        dA = (comps[c,11] - comps[c,10]) * samples[i,col+1] + comps[c,10]
+        col += 2
+        cosA = math.cos(dA)
+        sinA = math.sin(dA)
+        nx = cosA * comps[c,4] + sinA * comps[c,6]
+        ny = comps[c,5]
+        nz = cosA * comps[c,6] - sinA * comps[c,4]
+        wx = comps[c,1] + dx - px
+      else:
+        nx = comps[c,4]
+        ny = comps[c,5]
+        nz = comps[c,6]
+        wx = comps[c,1] - px
+      wy = comps[c,2] - py
+      wz = comps[c,3] - pz
+      un = nx * ux + ny * uy + nz * uz
+      s = (nx * wx + ny * wy + nz * wz) / un
+      px += s * ux
+      py += s * uy
+      pz += s * uz
+
+      # footprint histogram cell
+      vx = px - comps[c,1]
+      vy = py - comps[c,2]
+      vz = pz - comps[c,3]
+      i0 = math.floor((vx * axes[c,0,0] + vy * axes[c,0,1] + vz * axes[c,0,2] - lo[c,0]) / width[c,0])
+      i1 = math.floor((vx * axes[c,1,0] + vy * axes[c,1,1] + vz * axes[c,1,2] - lo[c,1]) / width[c,1])
+      if(i0 >= 0 and i0 < bins and i1 >= 0 and i1 < bins):
+        cells[i,c] = i0 * bins + i1
+
+      if(comps[c,0] == _MIRROR):
+        if(abs(pz - comps[c,3]) <= comps[c,7] * abs(nx)):
+          hits[i] |= 1 << c
+          ux -= 2. * un * nx
+          uy -= 2. * un * ny
+          uz -= 2. * un * nz
+      else:
+        L = math.sqrt(vx * vx + vy * vy + vz * vz)
+        if(comps[c,12] <= L and L <= comps[c,13]):
+          fate[i] = c
+          break
+
+    origin[i,0] = px
+    origin[i,1] = py
+    origin[i,2] = pz
+    direction[i,0] = ux
+    direction[i,1] = uy
+    direction[i,2] = uz
+
+
+if(numba is not None):
+  prange = numba.prange
+  _traceRaysCompiled = numba.njit(parallel=True, cache=True)(_traceRays)
+else:
+  prange = range
+  _traceRaysCompiled = None
+
+
+def trace(beamline, samples, bundle, tally=None):
+  """ Trace rays with the compiled kernel into a RayBundle, and fill a Tally
+      samples: (N, nsrc + ndim) source and jitter samples in [0,1) (see Beamline.sampleDims)
+      bundle: RayBundle of N rays receiving the rays leaving the last component
+              (absorbed rays are left on the plane of the absorbing collimator)
+  """
+  if(not available()):
+    raise Exception('Compiled kernels need numba')
+  src, comps, axes = pack(beamline)
+  ncomp = comps.shape[0]
+  n = samples.shape[0]
+  bins = tally.bins if(tally is not None) else 1
+  if(tally is not None):
+    lo = tally.ranges[:,:,0]
+    width = (tally.ranges[:,:,1] - lo) / bins
+  else:
+    lo = np.zeros((ncomp, 2))
+    width = np.ones((ncomp, 2))
+  origin = np.empty((n, 3))
+  direction = np.empty((n, 3))
+  fate = np.empty(n, dtype=np.int32)
+  hits = np.empty(n, dtype=np.int64)
+  cells = np.empty((n, ncomp), dtype=np.int64)
+  _traceRaysCompiled(np.ascontiguousarray(samples, dtype=np.float64), src, comps, axes, lo, width, bins,
+                     origin, direction, fate, hits, cells)
+
+  bundle.origin[:] = origin
+  bundle.direction[:] = direction
+  bundle.alive[:] = fate == ncomp
+  if(tally is not None):
+    fill(tally, comps, fate, hits, cells)
+  return bundle
+
+
+def fill(tally, comps, fate, hits, cells):
+  """ Add the kernel outputs of one batch to a Tally
+  """
+  ncomp = comps.shape[0]
+  counts = np.bincount(fate, minlength=ncomp+1)
+  reached = len(fate) - np.concatenate([[0], np.cumsum(counts[:-1])])[:ncomp]
+  for c in range(ncomp):
+    if(comps[c,0] == _MIRROR):
+      n_mask = np.count_nonzero((hits >> c) & 1)
+    else:
+      n_mask = counts[c]
+    cell = cells[:,c]
+    tally.n_in[c] += reached[c]
+    tally.n_mask[c] += n_mask
+    tally.hist[c] += np.bincount(cell[cell >= 0], minlength=tally.bins*tally.bins).reshape(tally.bins, tally.bins)
+  tally.count(len(fate), counts[ncomp])
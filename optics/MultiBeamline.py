@@ -0,0 +1,125 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .Tally import Tally
+
+class MultiBeamline():
+  """
+  Class of several beamlines (branches) traced from one shared batch of source samples
+  Every ray number uses the same source and jitter samples in all branches, and the rays
+  of a source shared by several branches are generated once.  Branches are traced one
+  after the other, each filling its own Tally; stream spreads chunks over processes.
+  Common samples also make the differences between branches less noisy than independent runs.
+  Properties:
+  * name: str, name of the set
+  * beamlines: list of Beamline, the branches
+  """
+  def __init__(self, name, beamlines):
+    """
+    name: string of name
+    beamlines: list of Beamline with distinct names
+    """
+    self.name = name
+    self.beamlines = list(beamlines)
+    names = [beamline.name for beamline in self.beamlines]
+    if(len(set(names)) != len(names)):
+      raise Exception('Wrong input: beamline names {:} must be distinct'.format(names))
+
+  def __getitem__(self, name):
+    """ Branch by name
+    """
+    for beamline in self.beamlines:
+      if(beamline.name == name):
+        return beamline
+    raise KeyError('No beamline {:} in {:}'.format(name, self.name))
+
+  def sampleDims(self):
+    """ Number of source samples and of jitter samples per ray shared by all branches
+    """
+    dims = [beamline.sampleDims() for beamline in self.beamlines]
+    return max(nsrc for nsrc, d in dims), max(sum(d) for nsrc, d in dims)
+
+  def run(self, n, rng=None, tallies=None, sampler=None):
+    """ Generate one batch of n source samples and trace it through every branch
+        Return a dict of beamline name to its list of Stage, as Beamline.trace.
+        rng: numpy.random.Generator for the samples (a new one if None)
+        tallies: dict of beamline name to Tally filled in place
+        sampler: Sampler drawing the samples (pseudo-random if None)
+    """
+    if(rng is None):
+      rng = np.random.default_rng()
+    nsrc, ndim = self.sampleDims()
+    if(sampler is None):
+      samples = rng.random((n, nsrc + ndim))
+    else:
+      samples = sampler.random(n, nsrc + ndim, rng)
+
+    # rays of each distinct source, generated once
+    rays = {}
+    for beamline in self.beamlines:
+      if(id(beamline.source) not in rays):
+        rays[id(beamline.source)] = beamline.source.getRays(n, samples=samples[:,:beamline.source._ndim])
+
+    stages = {}
+    for beamline in self.beamlines:
+      tally = None if(tallies is None) else tallies.get(beamline.name)
+      stages[beamline.name] = beamline.trace(rays[id(beamline.source)], tally=tally, samples=samples[:,nsrc:])
+    return stages
+
+  def stream(self, n, chunk=100000, seed=None, tallies=None, workers=1, sampler=None):
+    """ Trace n source rays chunk by chunk through every branch and fold them into Tallies
+        Chunks draw from SeedSequence.spawn streams as Beamline.stream, so the result for
+        a given (seed, n, chunk) is identical whatever the number of workers.
+        Return a dict of beamline name to Tally.
+        seed: int or numpy.random.SeedSequence (fresh entropy if None)
+        tallies: dict of beamline name to Tally to accumulate into (new ones if None)
+        workers: number of processes (1 runs in this process; None uses all cores)
+        sampler: Sampler of the source and jitter samples (pseudo-random if None);
+                 chunk is rounded down to its chunkSize
+    """
+    if(sampler is not None):
+      chunk = sampler.chunkSize(chunk)
+    if(tallies is None):
+      tallies = {}
+    for beamline in self.beamlines:
+      if(beamline.name not in tallies):
+        tallies[beamline.name] = Tally(beamline.components)
+    if(not isinstance(seed, np.random.SeedSequence)):
+      seed = np.random.SeedSequence(seed)
+    bins = dict((name, tally.bins) for name, tally in tallies.items())
+
+    nchunk = -(-n // chunk)
+    sizes = [min(chunk, n - i * chunk) for i in range(nchunk)]
+    seeds = seed.spawn(nchunk)
+    if(workers == 1):
+      for m, ss in zip(sizes, seeds):
+        _mergeTallies(tallies, _streamChunk(self, m, ss, bins, sampler))
+    else:
+      depth = 2 * (workers or os.cpu_count() or 1)   # chunks in flight
+      with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_streamChunk, self, m, ss, bins, sampler)
+                   for m, ss in zip(sizes[:depth], seeds[:depth])]
+        submitted = len(futures)
+        while(futures):   # merge in chunk order
+          _mergeTallies(tallies, futures.pop(0).result())
+          if(submitted < nchunk):
+            futures.append(pool.submit(_streamChunk, self, sizes[submitted], seeds[submitted], bins, sampler))
+            submitted += 1
+    return tallies
+
+
+def _mergeTallies(tallies, chunk_tallies):
+  """ Merge the dict of beamline name to Tally of one chunk into tallies
+  """
+  for name, tally in chunk_tallies.items():
+    tallies[name].merge(tally)
+
+
+def _streamChunk(multi, n, seed, bins, sampler=None):
+  """ Tallies of one chunk of n rays traced through every branch with its own random stream
+  """
+  tallies = dict((beamline.name, Tally(beamline.components, bins[beamline.name])) for beamline in multi.beamlines)
+  multi.run(n, np.random.default_rng(seed), tallies, sampler)
+  return tallies
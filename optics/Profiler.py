@@ -0,0 +1,94 @@
+import time
+
+import numpy as np
+
+from .RayBundle import RayBundle
+
+class Profiler():
+  """
+  Class recording the transport wall time and ray flow of each beamline component
+  Set Beamline.profiler to a Profiler to enable it; a beamline without one pays a single
+  attribute check per component and batch.
+  Properties:
+  * records: dict of component name to dict with
+             calls, seconds, rays_in, rays_out, absorbed, missed
+             The compiled kernels of Beamline.runBundle fuse the source and all components,
+             so they are recorded as one entry, 'kernel', absorbing the rays not transmitted
+             (its first call includes the Numba compilation).
+  """
+  _fields = ('calls', 'seconds', 'rays_in', 'rays_out', 'absorbed', 'missed')
+  def __init__(self):
+    self.records = {}
+
+  def transport(self, comp, rays, rng, tally, samples=None):
+    """ Call comp.transport(rays, rng, tally, samples) and record its time and ray counts
+        rays: ray bundle (N,2,3) or RayBundle, whose alive rays are counted
+    """
+    n_in = _count(rays)
+    t0 = time.perf_counter()
+    out, mask = comp.transport(rays, rng, tally, samples)
+    seconds = time.perf_counter() - t0
+
+    n_mask = int(mask.sum())
+    if(comp._flag == 'absorbed'):
+      self.record(comp.name, seconds, n_in, _count(out), absorbed=n_mask)
+    else:
+      self.record(comp.name, seconds, n_in, _count(out), missed=n_in - n_mask)
+    return out, mask
+
+  def record(self, name, seconds, rays_in, rays_out, absorbed=0, missed=0):
+    """ Add one call of name to the records
+    """
+    rec = self.records.get(name)
+    if(rec is None):
+      rec = self.records[name] = dict((field, 0) for field in self._fields)
+    rec['calls'] += 1
+    rec['seconds'] += seconds
+    rec['rays_in'] += int(rays_in)
+    rec['rays_out'] += int(rays_out)
+    rec['absorbed'] += int(absorbed)
+    rec['missed'] += int(missed)
+
+  def merge(self, other):
+    """ Add the records of another Profiler, e.g. from a worker process
+    """
+    for name, rec in other.records.items():
+      if(name not in self.records):
+        self.records[name] = dict((field, 0) for field in self._fields)
+      for field in self._fields:
+        self.records[name][field] += rec[field]
+    return self
+
+  def reset(self):
+    self.records = {}
+
+  def report(self):
+    """ Records with the share of the total transport time and the rays per second
+    """
+    total = sum(rec['seconds'] for rec in self.records.values())
+    report = {}
+    for name, rec in self.records.items():
+      rec = dict(rec)
+      rec['time_fraction'] = rec['seconds'] / total if(total > 0) else 0.
+      rec['rays_per_second'] = rec['rays_in'] / rec['seconds'] if(rec['seconds'] > 0) else 0.
+      report[name] = rec
+    return report
+
+  def table(self):
+    """ Report as a text table
+    """
+    lines = ['{:10s} {:>6s} {:>10s} {:>6s} {:>12s} {:>12s} {:>12s} {:>12s} {:>12s}'.format(
+             'component', 'calls', 'seconds', 'time%', 'rays/s', 'rays in', 'rays out', 'absorbed', 'missed')]
+    for name, rec in self.report().items():
+      lines.append('{:10s} {:6d} {:10.4f} {:6.1f} {:12.4g} {:12d} {:12d} {:12d} {:12d}'.format(
+                   name, rec['calls'], rec['seconds'], 100. * rec['time_fraction'], rec['rays_per_second'],
+                   rec['rays_in'], rec['rays_out'], rec['absorbed'], rec['missed']))
+    return '\n'.join(lines)
+
+
+def _count(rays):
+  """ Number of rays of a bundle (N,2,3), or of alive rays of a RayBundle
+  """
+  if(isinstance(rays, RayBundle)):
+    return np.count_nonzero(rays.alive)
+  return rays.shape[0]
@@ -0,0 +1,46 @@
+import numpy as np
+
+class RayBundle():
+  """
+  Class of a ray bundle stored as separate contiguous arrays, transported in place
+  Components move origin to their plane and turn direction on reflection without
+  re-normalizing or reallocating the bundle; absorbed rays are only cleared in alive.
+  Properties:
+  * origin: (N,3) ray points (on the last component plane after a transport)
+  * direction: (N,3) unit ray directions
+  * alive: (N,) mask of the rays not absorbed
+  * weight: (N,) ray weights, carried through the transport
+  * dtype: float dtype of origin, direction and weight
+  """
+  def __init__(self, n, dtype=np.float32):
+    """
+    n: number of rays
+    dtype: float dtype of the ray arrays (float32 halves the memory traffic of float64,
+           with a position resolution of ~1e-7 of the coordinates)
+    """
+    self.dtype = np.dtype(dtype)
+    self.origin = np.zeros((n, 3), dtype=self.dtype)
+    self.direction = np.zeros((n, 3), dtype=self.dtype)
+    self.alive = np.ones(n, dtype=bool)
+    self.weight = np.ones(n, dtype=self.dtype)
+
+  @classmethod
+  def fromRays(cls, rays, dtype=np.float32):
+    """ Bundle of rays given as (N,2,3) point pairs
+    """
+    bundle = cls(rays.shape[0], dtype)
+    bundle.origin[:] = rays[:,0]
+    u = rays[:,1] - rays[:,0]
+    bundle.direction[:] = u / np.linalg.norm(u, axis=1)[:,np.newaxis]
+    return bundle
+
+  def __len__(self):
+    return self.origin.shape[0]
+
+  def toRays(self, length=1.):
+    """ Alive rays as (M,2,3) point pairs of the given length
+    """
+    rays = np.empty((np.count_nonzero(self.alive), 2, 3))
+    rays[:,0] = self.origin[self.alive]
+    rays[:,1] = rays[:,0] + length * self.direction[self.alive]
+    return rays
@@ -0,0 +1,80 @@
+import json
+import os
+
+import numpy as np
+
+class RayStore():
+  """
+  Class of a directory of memory-mapped .npy files holding the rays of every beamline stage
+  For each stage (the source bundle, then one per component) it stores
+  * rays: (N,2,3) output rays, indexed by source ray; NaN where the ray is no longer alive
+  * alive: (N,) mask of the source rays alive after the stage
+  Chunks are written in place as they are traced; reopened stores are read-only memmaps.
+  Properties:
+  * path: str, store directory
+  * n: number of source rays
+  * names: list of stage names
+  """
+  _manifest = 'store.json'
+  def __init__(self, path, beamline, n):
+    """ Create a store for n source rays traced through beamline
+    """
+    self.path = path
+    self.n = n
+    self.names = ['source'] + [comp.name for comp in beamline.components]
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, self._manifest), 'w') as f:
+      json.dump({'beamline': beamline.name, 'n': n, 'names': self.names}, f)
+    self._rays = []
+    self._alive = []
+    for i in range(len(self.names)):
+      self._rays.append(np.lib.format.open_memmap(self._file(i, 'rays'), mode='w+',
+                                                  dtype=np.float64, shape=(n, 2, 3)))
+      self._alive.append(np.lib.format.open_memmap(self._file(i, 'alive'), mode='w+',
+                                                   dtype=bool, shape=(n,)))
+
+  @classmethod
+  def open(cls, path, mode='r'):
+    """ Reopen a store without loading it; mode 'r' (read-only) or 'r+'
+    """
+    store = cls.__new__(cls)
+    store.path = path
+    with open(os.path.join(path, cls._manifest)) as f:
+      manifest = json.load(f)
+    store.n = manifest['n']
+    store.names = manifest['names']
+    store._rays = [np.load(store._file(i, 'rays'), mmap_mode=mode) for i in range(len(store.names))]
+    store._alive = [np.load(store._file(i, 'alive'), mmap_mode=mode) for i in range(len(store.names))]
+    return store
+
+  def _file(self, i, kind):
+    return os.path.join(self.path, '{:02d}_{:}_{:}.npy'.format(i, self.names[i], kind))
+
+  def _index(self, stage):
+    return self.names.index(stage) if(isinstance(stage, str)) else stage
+
+  def rays(self, stage):
+    """ (N,2,3) memmap of the output rays of a stage, by index or name
+    """
+    return self._rays[self._index(stage)]
+
+  def alive(self, stage):
+    """ (N,) memmap of the alive mask after a stage, by index or name
+    """
+    return self._alive[self._index(stage)]
+
+  def write(self, start, stages):
+    """ Write the stages of one traced chunk, whose first source ray is number start
+    """
+    m = stages[0].rays.shape[0]
+    for rays, alive, stage in zip(self._rays, self._alive, stages):
+      out = rays[start:start+m]
+      out[...] = np.nan
+      out[stage.alive] = stage.rays
+      alive[start:start+m] = stage.alive
+
+  def flush(self):
+    """ Write pending changes to disk
+    """
+    for mm in self._rays + self._alive:
+      mm.flush()
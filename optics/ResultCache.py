@@ -0,0 +1,84 @@
+import hashlib
+import os
+
+import numpy as np
+
+from .Beamline import paramKey
+from .Tally import Tally
+
+class ResultCache():
+  """
+  Class of a local directory of traced Tally results, keyed by beamline configuration
+  Each result is one .npz file; the least recently used ones are evicted beyond max_bytes.
+  Properties:
+  * path: str, cache directory
+  * max_bytes: maximum total size of the cached files
+  """
+  def __init__(self, path='.raytrace_cache', max_bytes=512*1024**2):
+    """
+    path: cache directory, created if missing
+    max_bytes: size bound of the directory
+    """
+    self.path = path
+    self.max_bytes = max_bytes
+    os.makedirs(path, exist_ok=True)
+
+  def key(self, beamline, n, chunk, seed, bins, sampler=None):
+    """ Hash of the source and component parameters, the seed, ray count, chunk size,
+        binning and sampler kind
+        seed: numpy.random.SeedSequence
+    """
+    h = hashlib.sha1()
+    for comp in [beamline.source] + beamline.components:
+      h.update(paramKey(comp).encode())
+    h.update(repr((seed.entropy, seed.spawn_key, seed.n_children_spawned, n, chunk, bins,
+                   'random' if(sampler is None) else sampler.kind)).encode())
+    return h.hexdigest()
+
+  def _file(self, key):
+    return os.path.join(self.path, key + '.npz')
+
+  def get(self, key):
+    """ Cached Tally of key, or None
+    """
+    fname = self._file(key)
+    try:
+      tally = Tally.load(fname)
+    except (OSError, ValueError, KeyError):
+      return None
+    os.utime(fname)   # mark as recently used
+    return tally
+
+  def put(self, key, tally):
+    """ Store a Tally under key, then evict the least recently used files beyond max_bytes
+    """
+    fname = self._file(key)
+    tmp = '{:}.{:d}.tmp'.format(fname, os.getpid())
+    with open(tmp, 'wb') as f:
+      tally.save(f)
+    os.replace(tmp, fname)
+    self._evict()
+
+  def _evict(self):
+    files = []
+    for name in os.listdir(self.path):
+      if(name.endswith('.npz')):
+        st = os.stat(os.path.join(self.path, name))
+        files.append((st.st_mtime, st.st_size, name))
+    files.sort()
+    total = sum(f[1] for f in files)
+    for mtime, size, name in files[:-1]:   # always keep the newest
+      if(total <= self.max_bytes):
+        break
+      try:
+        os.remove(os.path.join(self.path, name))
+      except FileNotFoundError:
+        pass
+      total -= size
+
+  def clear(self):
+    """ Remove all cached results
+    """
+    for name in os.listdir(self.path):
+      if(name.endswith('.npz')):
+        os.remove(os.path.join(self.path, name))
@@ -0,0 +1,84 @@
+import numpy as np
+
+try:
+  from scipy.stats import qmc
+except ImportError:
+  qmc = None
+
+class Sampler():
+  """
+  Class of unit hypercube samplers feeding the source disks and the mirror jitter
+  Every batch is an independent randomization, so chunks of a stream are independent
+  replicates and the usual chunk-to-chunk error estimates still apply.
+  Kinds:
+  * 'random': independent pseudo-random numbers
+  * 'stratified': Latin hypercube, one point per stratum on every dimension
+  * 'halton': Halton sequence with random digit permutation scrambling
+  * 'sobol': scrambled Sobol sequence (needs scipy)
+  """
+  _kinds = ('random', 'stratified', 'halton', 'sobol')
+  def __init__(self, kind='random'):
+    """
+    kind: 'random', 'stratified', 'halton' or 'sobol'
+    """
+    if(kind not in self._kinds):
+      raise Exception('Wrong kind {:}.  Must be one of {:}'.format(kind, self._kinds))
+    if(kind == 'sobol' and qmc is None):
+      raise Exception('Sobol sampling needs scipy')
+    self.kind = kind
+
+  def random(self, n, d, rng=None):
+    """ (n,d) samples in [0,1)
+        rng: numpy.random.Generator for the randomization (a new one if None)
+    """
+    if(rng is None):
+      rng = np.random.default_rng()
+    if(self.kind == 'random'):
+      return rng.random((n, d))
+    elif(self.kind == 'stratified'):
+      u = np.empty((n, d))
+      for j in range(d):
+        u[:,j] = (rng.permutation(n) + rng.random(n)) / n
+      return u
+    elif(self.kind == 'halton'):
+      return _scrambledHalton(n, d, rng)
+    else:
+      try:
+        engine = qmc.Sobol(d, scramble=True, rng=rng)
+      except TypeError:   # scipy < 1.15
+        engine = qmc.Sobol(d, scramble=True, seed=rng)
+      # balanced in blocks of 2**m points; other n take the first points of the next block
+      return engine.random_base2(max(int(n - 1).bit_length(), 0))[:n]
+
+  def chunkSize(self, chunk):
+    """ Largest batch size up to chunk that keeps the sampler balanced:
+        a power of two for 'sobol', chunk itself otherwise
+    """
+    if(self.kind == 'sobol'):
+      return 1 << (int(chunk).bit_length() - 1)
+    return chunk
+
+def _primes(d):
+  """ First d prime numbers
+  """
+  primes = []
+  k = 2
+  while(len(primes) < d):
+    if(all(k % p for p in primes)):
+      primes.append(k)
+    k += 1
+  return primes
+
+
+def _scrambledHalton(n, d, rng):
+  """ (n,d) Halton points with an independent random digit permutation on each digit
+  """
+  u = np.zeros((n, d))
+  for j, b in enumerate(_primes(d)):
+    i = np.arange(n)
+    f = 1. / b
+    for k in range(int(np.ceil(52 / np.log2(b)))):   # down to double precision
+      u[:,j] += rng.permutation(b)[i % b] * f
+      i //= b
+      f /= b
+  return u
@@ -0,0 +1,103 @@
+import numpy as np
+
+class Tally():
+  """
+  Running counts and footprint histograms of a beamline trace, filled batch by batch
+  Components fill their own entry in place during transport; no rays are kept.
+  Properties:
+  * names: list of component names
+  * flags: list of what each component flags: 'hit' (mirror) or 'absorbed' (collimator)
+  * bins: number of histogram bins on each footprint axis
+  * ranges: (ncomp,2,2) footprint histogram range [[umin,umax],[vmin,vmax]] of each component
+  * n_rays: number of source rays traced
+  * n_in: (ncomp,) number of rays reaching each component
+  * n_mask: (ncomp,) number of rays flagged by each component
+  * n_out: number of rays leaving the last component
+  * hist: (ncomp,bins,bins) footprint histograms of the incoming rays on each component
+  """
+  def __init__(self, components, bins=64):
+    """
+    components: list of components in beam order
+    bins: number of histogram bins on each footprint axis
+    """
+    self.names = [comp.name for comp in components]
+    self.flags = [comp._flag for comp in components]
+    self.bins = bins
+    self.ranges = np.array([comp.footprintRange() for comp in components], dtype=np.float64)
+    self._index = dict((name, i) for i, name in enumerate(self.names))
+    self.n_rays = 0
+    self.n_in = np.zeros(len(self.names), dtype=np.int64)
+    self.n_mask = np.zeros_like(self.n_in)
+    self.n_out = 0
+    self.hist = np.zeros((len(self.names), bins, bins), dtype=np.int64)
+
+  def count(self, n_rays, n_out):
+    """ Add the source and transmitted rays of one traced batch
+    """
+    self.n_rays += n_rays
+    self.n_out += n_out
+
+  def fill(self, name, uv, mask):
+    """ Fill the entry of a component with one batch
+        uv: (N,2) footprint coordinates of the incoming rays on the component
+        mask: (N,) rays flagged by the component
+    """
+    i = self._index[name]
+    self.n_in[i] += mask.shape[0]
+    self.n_mask[i] += np.count_nonzero(mask)
+
+    lo = self.ranges[i,:,0]
+    width = (self.ranges[i,:,1] - lo) / self.bins
+    idx = np.floor((uv - lo) / width).astype(np.int64)
+    inside = np.all((idx >= 0) & (idx < self.bins), axis=1)
+    idx = idx[inside]
+    self.hist[i] += np.bincount(idx[:,0] * self.bins + idx[:,1],
+                                minlength=self.bins*self.bins).reshape(self.bins, self.bins)
+
+  def merge(self, other):
+    """ Add the counts and histograms of another Tally of the same beamline
+    """
+    if(self.names != other.names or self.bins != other.bins):
+      raise Exception('Wrong input: tally of {:} cannot merge {:}'.format(self.names, other.names))
+    self.n_rays += other.n_rays
+    self.n_in += other.n_in
+    self.n_mask += other.n_mask
+    self.n_out += other.n_out
+    self.hist += other.hist
+    return self
+
+  def fractions(self):
+    """ Fraction of the source rays absorbed by each collimator or missing each mirror,
+        and transmitted through the beamline
+    """
+    n = max(self.n_rays, 1)
+    frac = {}
+    for name, flag, n_in, n_mask in zip(self.names, self.flags, self.n_in, self.n_mask):
+      frac[name] = (n_mask if(flag == 'absorbed') else n_in - n_mask) / n
+    frac['transmitted'] = self.n_out / n
+    return frac
+
+  def save(self, path):
+    """ Save to a .npz file
+    """
+    np.savez(path, names=self.names, flags=self.flags, bins=self.bins, ranges=self.ranges,
+             n_rays=self.n_rays, n_in=self.n_in, n_mask=self.n_mask, n_out=self.n_out,
+             hist=self.hist)
+
+  @classmethod
+  def load(cls, path):
+    """ Load a Tally saved with save()
+    """
+    data = np.load(path)
+    tally = cls.__new__(cls)
+    tally.names = [str(name) for name in data['names']]
+    tally.flags = [str(flag) for flag in data['flags']]
+    tally.bins = int(data['bins'])
+    tally.ranges = data['ranges']
+    tally._index = dict((name, i) for i, name in enumerate(tally.names))
+    tally.n_rays = int(data['n_rays'])
+    tally.n_in = data['n_in']
+    tally.n_mask = data['n_mask']
+    tally.n_out = int(data['n_out'])
+    tally.hist = data['hist']
+    return tally
@@ -1,4 +1,28 @@
 from .Collimator import Collimator
 from .FlatMirror import FlatMirror
 from .CrissCrossSource import CrissCrossSource
-import geometry as g
+from .Beamline import Beamline, Stage
+from .MultiBeamline import MultiBeamline
+from .Tally import Tally
+from .Profiler import Profiler
+from .Sampler import Sampler
+from .ResultCache import ResultCache
+from .RayStore import RayStore
+from .RayBundle import RayBundle
+from .DensityMap import DensityMap
+from . import geometry as g
+
+__all__ = ['Collimator', 'FlatMirror', 'CrissCrossSource', 'Beamline', 'Stage', 'MultiBeamline', 'Tally', 'Profiler', 'Sampler',
+           'ResultCache', 'RayStore', 'RayBundle', 'DensityMap', 'g']
+# Renderer and ScanAnimation are left out of __all__ so that "from optics import *" does not import matplotlib
+
+
+def __getattr__(name):
+  # the drawing layer imports matplotlib, so load it only when asked for
+  if(name == 'Renderer'):
+    from .drawing import Renderer
+    return Renderer
+  if(name == 'ScanAnimation'):
+    from .animation import ScanAnimation
+    return ScanAnimation
+  raise AttributeError('module {:} has no attribute {:}'.format(__name__, name))
@@ -0,0 +1,130 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .Beamline import Stage
+from .drawing import Renderer
+
+class ScanAnimation():
+  """
+  Class rendering a parameter scan of a beamline to an image sequence or a video file
+  A pool of worker processes traces the upcoming scan steps while the main process draws
+  the current one, so with two or more cores a scan takes about the time of the slower of
+  tracing and drawing.  Each step traces its own copy of the beamline, so steps are
+  absolute settings.
+  Properties:
+  * beamline: Beamline scanned
+  * steps: list of picklable functions step(beamline) setting the parameters of one step
+           on a copy, e.g. functools.partial(setMirrorAngle, mirror='M1K3', A=A) with
+           setMirrorAngle defined at module level (lambdas cannot be sent to the workers)
+  * n: number of source rays traced per step
+  * seed: numpy.random.SeedSequence; step i draws from its i-th spawned stream
+  """
+  def __init__(self, beamline, steps, n=20, seed=None):
+    """
+    beamline: Beamline to scan
+    steps: list of picklable functions step(beamline) applied to a copy of beamline at each step
+    n: number of source rays per step
+    seed: int or numpy.random.SeedSequence (fresh entropy if None)
+    """
+    self.beamline = beamline
+    self.steps = list(steps)
+    self.n = n
+    self.seed = seed if(isinstance(seed, np.random.SeedSequence)) else np.random.SeedSequence(seed)
+
+  def frames(self, workers=2, prefetch=None, max_rays=None):
+    """ Generate (step, beamline copy, stages) in step order, traced ahead by a process pool
+        workers: number of tracing processes
+        prefetch: number of steps traced ahead of the one returned (2*workers if None)
+        max_rays: keep a random subset of at most max_rays source rays in the returned stages,
+                  so that only the drawn rays are sent back from the workers (all if None)
+    """
+    if(prefetch is None):
+      prefetch = 2 * workers
+    seeds = self.seed.spawn(len(self.steps))
+    with ProcessPoolExecutor(workers) as pool:
+      futures = {}
+      for i in range(len(self.steps)):
+        for k in range(i, min(i + prefetch + 1, len(self.steps))):
+          if(k not in futures):
+            futures[k] = pool.submit(_traceStep, self.beamline, self.steps[k], self.n, seeds[k], max_rays)
+        beamline, stages = futures.pop(i).result()
+        yield i, beamline, stages
+
+  def save(self, path, fps=2, workers=2, title='Step {:d}', figsize=(7,4), dpi=100, max_rays=1000, limits=None):
+    """ Render every step and write the frames, without a display
+        path: image sequence pattern with one {} field for the step, e.g. 'scan/{:04d}.png',
+              or a video file: .gif (Pillow) or any other extension (ffmpeg, e.g. .mp4)
+        fps: frames per second of a video
+        workers: number of tracing processes
+        title: format string of the frame title, given the step number (None for no title)
+        limits: dict of Renderer.setLimits arguments
+        Return the list of files written.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize, dpi=dpi, facecolor='white')
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    sequence = '{' in path
+    if(sequence):
+      directory = os.path.dirname(path)
+      if(directory):
+        os.makedirs(directory, exist_ok=True)
+      writer = None
+    else:
+      from matplotlib import animation
+      if(path.lower().endswith('.gif')):
+        writer = animation.PillowWriter(fps=fps)
+      else:
+        writer = animation.FFMpegWriter(fps=fps)
+      writer.setup(fig, path, dpi)
+
+    files = []
+    try:
+      for i, beamline, stages in self.frames(workers, max_rays=max_rays):
+        ax.clear()
+        renderer = Renderer(ax, max_rays)
+        renderer.drawComponents([beamline.source] + beamline.components)
+        renderer.drawStages(beamline, stages)
+        renderer.setLimits(**(limits or {}))
+        if(title is not None):
+          ax.set_title(title.format(i))
+        fig.tight_layout()
+        if(sequence):
+          files.append(path.format(i))
+          fig.savefig(files[-1])
+        else:
+          writer.grab_frame()
+    finally:
+      if(writer is not None):
+        writer.finish()
+    return files if(sequence) else [path]
+
+
+def _traceStep(beamline, step, n, seed, max_rays=None):
+  """ (beamline, stages) of one scan step traced in a worker process, on its own copy of beamline
+  """
+  step(beamline)
+  rng = np.random.default_rng(seed)
+  stages = beamline.run(n, rng)
+  if(max_rays is not None and n > max_rays):
+    stages = _selectStages(stages, np.sort(rng.choice(n, max_rays, replace=False)))
+  return beamline, stages
+
+
+def _selectStages(stages, sel):
+  """ Stages restricted to the source rays sel (sorted indices)
+  """
+  selected = []
+  prev_pos = np.arange(stages[0].alive.shape[0])
+  prev_alive = np.ones_like(stages[0].alive)
+  for stage in stages:
+    pos = np.cumsum(stage.alive) - 1
+    alive = stage.alive[sel]
+    mask = None if(stage.mask is None) else stage.mask[prev_pos[sel[prev_alive[sel]]]]
+    selected.append(Stage(stage.name, stage.rays[pos[sel[alive]]], alive, mask))
+    prev_pos, prev_alive = pos, stage.alive
+  return selected
@@ -0,0 +1,156 @@
+import numpy as np
+from matplotlib.collections import LineCollection
+
+from . import geometry as g
+
+class Renderer():
+  """
+  Class drawing components and traced rays on the Z-X plane (horizontal)
+  Each stage of rays is one LineCollection built from a preallocated segment array.
+  Properties:
+  * ax: matplotlib axes to draw on
+  * max_rays: maximum number of source rays drawn; larger traces are randomly decimated
+  * draw_min, draw_max: (2,) X/Z extent of the drawn components
+  """
+  _cl = 'blue'   # color of rays
+  _lw = 0.5      # linewidth of rays
+  def __init__(self, ax, max_rays=1000, rng=None):
+    """
+    ax: matplotlib axes
+    max_rays: maximum number of rays to draw
+    rng: numpy.random.Generator for the decimation (a new one if None)
+    """
+    self.ax = ax
+    self.max_rays = max_rays
+    self.rng = np.random.default_rng() if(rng is None) else rng
+    self.draw_min = np.array([ np.inf,  np.inf])
+    self.draw_max = np.array([-np.inf, -np.inf])
+
+  def drawComponents(self, comp_list):
+    """ Draw components and update the draw extent
+    """
+    for comp in comp_list:
+      self.ax.add_collection(comp.drawZX())
+      self.draw_min = np.minimum(self.draw_min, comp.draw_min)
+      self.draw_max = np.maximum(self.draw_max, comp.draw_max)
+
+  def drawStages(self, beamline, stages):
+    """ Draw the rays of traced stages from Beamline.trace, one LineCollection per stage
+        Rays removed by a component end on its nominal plane.
+    """
+    n = stages[0].rays.shape[0]
+    if(n > self.max_rays):
+      sel = np.sort(self.rng.choice(n, self.max_rays, replace=False))
+    else:
+      sel = np.arange(n)
+
+    prev_alive = np.ones(n, dtype=bool)
+    prev_pos = np.arange(n)
+    for comp, prev, stage in zip(beamline.components, stages[:-1], stages[1:]):
+      # selected rays entering the component, and their index in each stage
+      sel = sel[prev_alive[sel]]
+      pos = np.cumsum(stage.alive) - 1
+      kept = stage.alive[sel]
+
+      p0 = prev.rays[prev_pos[sel],0]
+      segs = np.empty((sel.shape[0], 2, 2))
+      segs[:,0] = p0[:,[2,0]]
+      segs[kept,1] = stage.rays[pos[sel[kept]],0][:,[2,0]]
+      if(not kept.all()):
+        gone = ~kept
+        u = prev.rays[prev_pos[sel[gone]],1] - p0[gone]
+        segs[gone,1] = g.PlaneIntersection(p0[gone], u, comp.loc, comp.norm)[:,[2,0]]
+      self.ax.add_collection(LineCollection(segs, linewidths=self._lw, colors=self._cl))
+      prev_alive = stage.alive
+      prev_pos = pos
+
+    # unit-length output rays of the last stage
+    last = stages[-1].rays[prev_pos[sel[prev_alive[sel]]]]
+    self.ax.add_collection(LineCollection(last[:,:,[2,0]], linewidths=self._lw, colors=self._cl))
+
+  def setLimits(self, pad=0.02, xmin=None, xmax=None, zmin=None, zmax=None):
+    """ Set the axes range to the draw extent with padding
+        xmin, xmax, zmin, zmax: overwrite the draw extent before padding
+    """
+    xmin = self.draw_min[0] if(xmin is None) else xmin
+    xmax = self.draw_max[0] if(xmax is None) else xmax
+    zmin = self.draw_min[1] if(zmin is None) else zmin
+    zmax = self.draw_max[1] if(zmax is None) else zmax
+    dz = zmax - zmin
+    dx = xmax - xmin
+    self.ax.set_xlim(left=zmin - pad * dz, right=zmax + pad * dz)
+    self.ax.set_ylim(bottom=xmin - pad * dx, top=xmax + pad * dx)
+
+
+def collimatorZX(comp):
+  """ LineCollection of a Collimator on the Z-X plane (horizontal); sets comp.draw_min/draw_max
+  """
+  rot = g.rot2D(comp.norm[0])
+  p0 = np.array([comp.loc[2], comp.loc[0]])
+  v1 = rot.dot([0., comp.iR])
+  v2 = rot.dot([0., comp.oR])
+  segs = np.array([ [p0+v1, p0+v2],
+                    [p0-v1, p0-v2]], dtype=np.float32)
+  ls = LineCollection(segs, linewidths=comp._lw, colors=comp._cl)
+
+  # update draw region
+  comp.draw_min = np.array([segs[:,:,1].min(), segs[:,:,0].min()])
+  comp.draw_max = np.array([segs[:,:,1].max(), segs[:,:,0].max()])
+
+  return ls
+
+
+def flatMirrorZX(comp):
+  """ LineCollection of a FlatMirror on the Z-X plane (horizontal); sets comp.draw_min/draw_max
+  """
+  if(comp.horizontal):  # horizontal reflection
+    # mirror body
+    rot = g.rot2D(comp.A)
+    p0 = np.array([comp.loc[2], comp.loc[0]])
+    v1 = rot.dot([comp.half_size[2], 0.])
+    v2 = rot.dot([0., -comp.sign * comp.half_size[0]])
+    mirror_segs = np.array([p0+v1, p0-v1, p0-v1+v2, p0+v1+v2, p0+v1], dtype=np.float32)
+    comp.draw_min = np.array([mirror_segs[:,1].min(),
+                              mirror_segs[:,0].min()],
+                            dtype=np.float32)
+    comp.draw_max = np.array([mirror_segs[:,1].max(),
+                              mirror_segs[:,0].max()],
+                            dtype=np.float32)
+
+    # mirror motion range
+    #  ** this part needs to be fixed to take +/- dA **
+    dz  = comp.half_size[2] * np.cos(comp.A - comp.dA[1])
+    dx1 = comp.half_size[2] * np.sin(np.abs(comp.A) + comp.dA[1])
+    dx2 = comp.half_size[2] * np.sin(np.abs(comp.A) - comp.dA[1])
+    range_segs = np.array([
+                    (comp.loc[2] + dz,
+                     comp.loc[0] + (comp.trans[0] + dx1) * comp.sign),
+                    (comp.loc[2] - dz,
+                     comp.loc[0] + (comp.trans[0] - dx2) * comp.sign),
+                    (comp.loc[2] - dz,
+                     comp.loc[0] - (comp.trans[1] + dx1) * comp.sign),
+                    (comp.loc[2] + dz,
+                     comp.loc[0] - (comp.trans[1] - dx2) * comp.sign),
+                    (comp.loc[2] + dz,
+                     comp.loc[0] + (comp.trans[0] + dx1) * comp.sign)],
+                  dtype=np.float32)
+    ls = LineCollection([mirror_segs, range_segs], linewidths=comp._lw,
+                linestyles='solid', colors=['gray', comp._cl])
+
+  else: # vertical reflection, draw dashed rectangle only
+    pass
+
+  return ls
+
+
+def crissCrossSourceZX(comp):
+  """ LineCollection of a CrissCrossSource on the Z-X plane (horizontal); sets comp.draw_min/draw_max
+  """
+  p1 = [comp.loc1[2], comp.loc1[0] + comp.size1 / 2]
+  p2 = [comp.loc1[2], comp.loc1[0] - comp.size1 / 2]
+  segs = np.array([[p1,p2]])
+  ls = LineCollection(segs, linewidths = 2, colors = 'black')
+
+  comp.draw_min = np.array([segs[:,:,1].min(), segs[:,:,0].min()])
+  comp.draw_max = np.array([segs[:,:,1].max(), segs[:,:,0].max()])
+  return ls
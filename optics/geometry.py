@@ -13,6 +13,11 @@ def rot2D(Angle):
   return np.array([[cosA, -sinA], [sinA, cosA]], dtype=np.float32)
 
 
+AxisX = np.array([1., 0., 0.])
+AxisY = np.array([0., 1., 0.])
+AxisZ = np.array([0., 0., 1.])
+
+
 def Rx(Angle):
   """ Rotation matrix along X-axis
   """
@@ -43,6 +48,25 @@ def Rz(Angle):
                    [  0.,    0., 1.]], dtype=np.float32)
 
 
+def Rotate(vec, axis, Angle):
+  """ Rotate vector (3,) or vector list (N,3) along a unit axis (3,), without rotation matrices
+      Angle: scalar, or (N,) for one angle per vector (a single vector is then broadcast to (N,3))
+      The result is in the float dtype of vec, as axis and Angle are cast to it.
+      Rodrigues formula: v cosA + (k x v) sinA + k (k.v) (1 - cosA)
+  """
+  axis = axis.astype(vec.dtype)
+  Angle = np.asarray(Angle, dtype=vec.dtype)
+  cosA = np.cos(Angle)
+  sinA = np.sin(Angle)
+  if(np.ndim(Angle) == 1):
+    cosA = cosA[:,np.newaxis]
+    sinA = sinA[:,np.newaxis]
+  kv = vec.dot(axis)
+  if(np.ndim(kv) == 1):
+    kv = kv[:,np.newaxis]
+  return vec * cosA + np.cross(axis, vec) * sinA + axis * (kv * (1. - cosA))
+
+
 def VectorNormalize(vec):
   """ Normalize vector (3,) or vector list (N,3).
       This fuction will overwrite values in vec
@@ -77,6 +101,20 @@ def Reflection(incident, norm, normalized=True):
     raise Exception('Wrong input: vector (3,) or vector list (N,3) only')
 
 
+def PlaneIntersection(point, direction, planePoint, planeNorm):
+  """ Intersection of lines with a plane
+      "point" and "direction" define the lines as vector (3,) or vector list (N,3)
+      "planePoint" and "planeNorm" (3,) define the plane
+  """
+  s = (planePoint - point).dot(planeNorm) / direction.dot(planeNorm)
+  if(len(direction.shape) == 1):   # single line
+    return point + s * direction
+  elif(len(direction.shape) == 2): # list of lines
+    return point + s[:,np.newaxis] * direction
+  else:
+    raise Exception('Wrong input: vector (3,) or vector list (N,3) only')
+
+
 class Plane2D():
   def __init__(self, point, norm):
     self.p = point
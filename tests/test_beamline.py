@@ -0,0 +1,191 @@
+import sys
+
+import numpy as np
+import pytest
+
+from optics import RayStore, ResultCache, g
+from TXIBeamlines import SXR, HXR
+
+
+class _Sequence():
+  """ Stand-in for numpy.random.Generator returning given samples in order from random()
+  """
+  def __init__(self, samples):
+    self._samples = iter(samples)
+
+  def random(self):
+    return next(self._samples)
+
+
+def _traceOneByOne(beamline, samples):
+  """ Alive mask and output rays (N,2,3) of the single-ray transport of each row of samples
+  """
+  alive = np.ones(samples.shape[0], dtype=bool)
+  out = np.zeros((samples.shape[0], 2, 3))
+  for i in range(samples.shape[0]):
+    rng = _Sequence(samples[i])
+    ray = beamline.source.getOneRay(rng)
+    for comp in beamline.components:
+      ray = comp.transport(ray, rng)
+      if(comp._flag == 'absorbed' and np.array_equal(ray[0], ray[1])):   # absorbed
+        alive[i] = False
+        break
+    out[i] = ray
+  return alive, out
+
+
+@pytest.mark.parametrize('make', [SXR, HXR])
+def test_trace_matches_single_ray_transport(make):
+  beamline = make()
+  n = 500
+  nsrc, dims = beamline.sampleDims()
+  samples = np.random.default_rng(7).random((n, nsrc + sum(dims)))
+
+  rays = beamline.source.getRays(n, samples=samples[:,:nsrc])
+  stages = beamline.trace(rays, samples=samples[:,nsrc:])
+  alive, out = _traceOneByOne(beamline, samples)
+
+  assert np.array_equal(stages[-1].alive, alive)
+  last = stages[-1].rays
+  assert np.allclose(last[:,0], out[alive,0], rtol=0, atol=1e-6)
+  u = (last[:,1] - last[:,0]) / np.linalg.norm(last[:,1] - last[:,0], axis=1)[:,np.newaxis]
+  v = (out[alive,1] - out[alive,0]) / np.linalg.norm(out[alive,1] - out[alive,0], axis=1)[:,np.newaxis]
+  assert np.allclose(u, v, rtol=0, atol=1e-6)
+
+
+def test_stream_independent_of_workers():
+  beamline = SXR()
+  serial = beamline.stream(20000, chunk=5000, seed=3, workers=1)
+  parallel = beamline.stream(20000, chunk=5000, seed=3, workers=2)
+  assert serial.n_rays == parallel.n_rays == 20000
+  assert serial.n_out == parallel.n_out
+  assert np.array_equal(serial.n_in, parallel.n_in)
+  assert np.array_equal(serial.n_mask, parallel.n_mask)
+  assert np.array_equal(serial.hist, parallel.hist)
+
+
+def _paths(stages):
+  """ (ncomp,N) mask of each component on the input rays, -1 where the ray did not reach it
+  """
+  paths = np.full((len(stages) - 1, stages[0].alive.shape[0]), -1)
+  for k, (prev, stage) in enumerate(zip(stages[:-1], stages[1:])):
+    paths[k, prev.alive] = stage.mask
+  return paths
+
+
+def _stageRays(stage, sel):
+  """ (M,2,3) point and unit direction of the input rays sel (alive in stage)
+  """
+  rays = stage.rays[(np.cumsum(stage.alive) - 1)[sel]]
+  u = rays[:,1] - rays[:,0]
+  return np.stack([rays[:,0], u / np.linalg.norm(u, axis=1)[:,np.newaxis]], axis=1)
+
+
+@pytest.mark.parametrize('make', [SXR, HXR])
+def test_jacobian_matches_central_differences(make):
+  beamline = make()
+  n = 1000
+  nsrc, dims = beamline.sampleDims()
+  samples = np.random.default_rng(5).random((n, nsrc + sum(dims)))
+  rays = beamline.source.getRays(n, samples=samples[:,:nsrc])
+  jitter = samples[:,nsrc:]
+  stages = beamline.trace(rays, samples=jitter, jacobian=True)
+
+  # sample column of each parameter and its range: translation then angle of each mirror
+  ranges = []
+  for name, param in beamline.jacobianParams():
+    comp = beamline[name]
+    ranges.append(comp.trans[1] - comp.trans[0] if(param == 'translation') else comp.dA[1] - comp.dA[0])
+  assert len(ranges) == jitter.shape[1]
+
+  d = 1e-7
+  for p, span in enumerate(ranges):
+    shifted = []
+    for sign in (1, -1):
+      perturbed = jitter.copy()
+      perturbed[:,p] += sign * d / span
+      shifted.append(beamline.trace(rays, samples=perturbed))
+    # rays taking the same path through the components in all three traces
+    same = np.all((_paths(shifted[0]) == _paths(stages)) & (_paths(shifted[1]) == _paths(stages)), axis=0)
+    for stage, plus, minus in zip(stages, *shifted):
+      sel = stage.alive & plus.alive & minus.alive & same
+      jac = stage.jac[(np.cumsum(stage.alive) - 1)[sel], p]
+      diff = (_stageRays(plus, sel) - _stageRays(minus, sel)) / (2 * d)
+      assert np.all(np.abs(diff - jac) <= 1e-5 * (1 + np.abs(jac))), (stage.name, p)
+
+
+def test_retrace_matches_trace():
+  beamline = SXR()
+  rays = beamline.source.getRays(5000, np.random.default_rng(11))
+  cached = beamline.trace(rays, np.random.default_rng(12), cache=True)
+
+  beamline['M2K3'].setA(beamline['M2K3'].A + 2e-5)
+  beamline['PC1K3'].setXYfromMirror(beamline['M2K3'])
+  retraced = beamline.retrace()
+  traced = beamline.trace(rays, np.random.default_rng(12))
+
+  assert [stage.name for stage in retraced] == [stage.name for stage in traced]
+  for old, new in zip(retraced, traced):
+    assert np.array_equal(old.alive, new.alive), old.name
+    assert np.array_equal(old.rays, new.rays), old.name
+  # stages upstream of M2K3 are re-used, M2K3 and downstream ones changed
+  assert retraced[2] is cached[2]
+  assert not np.array_equal(retraced[3].rays, cached[3].rays)
+
+
+def _assertSameTally(a, b):
+  assert a.n_rays == b.n_rays
+  assert a.n_out == b.n_out
+  assert np.array_equal(a.n_in, b.n_in)
+  assert np.array_equal(a.n_mask, b.n_mask)
+  assert np.array_equal(a.hist, b.hist)
+
+
+def test_stream_cache_hit(tmp_path, monkeypatch):
+  beamline = SXR()
+  cache = ResultCache(str(tmp_path))
+  traced = beamline.stream(20000, chunk=5000, seed=4, cache=cache)
+  key = cache.key(beamline, 20000, 5000, np.random.SeedSequence(4), traced.bins)
+  assert cache.get(key) is not None
+
+  def noTrace(*args, **kwargs):
+    raise AssertionError('cache hit traced rays')
+  monkeypatch.setattr(sys.modules['optics.Beamline'], '_streamChunk', noTrace)
+  _assertSameTally(beamline.stream(20000, chunk=5000, seed=4, cache=cache), traced)
+
+  beamline['M2K3'].setA(beamline['M2K3'].A + 2e-5)
+  assert cache.key(beamline, 20000, 5000, np.random.SeedSequence(4), traced.bins) != key
+
+
+def test_ray_store_round_trip(tmp_path):
+  beamline = SXR()
+  path = str(tmp_path / 'rays')
+  tally = beamline.stream(12000, chunk=5000, seed=6, sink=RayStore(path, beamline, 12000))
+
+  store = RayStore.open(path)
+  assert store.names == ['source'] + [comp.name for comp in beamline.components]
+  assert np.count_nonzero(store.alive(0)) == tally.n_rays
+  assert np.count_nonzero(store.alive(-1)) == tally.n_out
+  assert np.array_equal(np.isnan(store.rays(-1)).all(axis=(1, 2)), ~store.alive(-1))
+
+
+@pytest.mark.parametrize('make', [SXR, HXR])
+def test_envelope_bounds_monte_carlo(make):
+  beamline = make()
+  envelope = beamline.envelope()[0]
+  stages = beamline.run(100000, np.random.default_rng(8))
+  for comp, prev, stage in zip(beamline.components, stages[:-1], stages[1:]):
+    if(comp._flag != 'absorbed'):
+      continue
+    p0 = prev.rays[:,0]
+    ps = g.PlaneIntersection(p0, prev.rays[:,1] - p0, comp.loc, comp.norm)[~stage.mask]
+    env = envelope[comp.name]
+    assert (env['transmitted'] > 0) == (ps.shape[0] > 0), comp.name
+    if(ps.shape[0] == 0):
+      continue
+    # edge rays sample the rims, so the envelope converges from inside as nrim grows
+    tol = 1e-3 * env['r_max']
+    uv = comp.footprint(ps)
+    assert np.all(uv.min(axis=0) >= env['low'] - tol), comp.name
+    assert np.all(uv.max(axis=0) <= env['high'] + tol), comp.name
+    assert np.linalg.norm(ps - comp.loc, axis=1).max() <= env['r_max'] + tol, comp.name
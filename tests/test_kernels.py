@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from optics import Kernels, RayBundle, Tally
+from TXIBeamlines import SXR, HXR
+
+
+def _kernelBody(beamline, samples, tally):
+  """ RayBundle of the uncompiled kernel loop, filling tally as Kernels.trace does
+  """
+  src, comps, axes = Kernels.pack(beamline)
+  n, ncomp = samples.shape[0], comps.shape[0]
+  lo = tally.ranges[:,:,0]
+  width = (tally.ranges[:,:,1] - lo) / tally.bins
+  origin = np.empty((n, 3))
+  direction = np.empty((n, 3))
+  fate = np.empty(n, dtype=np.int32)
+  hits = np.empty(n, dtype=np.int64)
+  cells = np.empty((n, ncomp), dtype=np.int64)
+  Kernels._traceRays(samples, src, comps, axes, lo, width, tally.bins, origin, direction, fate, hits, cells)
+  Kernels.fill(tally, comps, fate, hits, cells)
+  bundle = RayBundle(n, np.float64)
+  bundle.origin[:] = origin
+  bundle.direction[:] = direction
+  bundle.alive[:] = fate == ncomp
+  return bundle
+
+
+def _assertSame(beamline, bundle, tally, ref, ref_tally):
+  assert np.array_equal(bundle.alive, ref.alive)
+  assert np.allclose(bundle.origin[ref.alive], ref.origin[ref.alive], rtol=0, atol=1e-9)
+  assert np.allclose(bundle.direction[ref.alive], ref.direction[ref.alive], rtol=0, atol=1e-12)
+  assert tally.n_rays == ref_tally.n_rays
+  assert tally.n_out == ref_tally.n_out
+  assert np.array_equal(tally.n_in, ref_tally.n_in)
+  assert np.array_equal(tally.n_mask, ref_tally.n_mask)
+  assert np.array_equal(tally.hist, ref_tally.hist)
+
+
+@pytest.mark.parametrize('make', [SXR, HXR])
+def test_kernel_body_matches_propagate(make):
+  beamline = make()
+  n = 2000
+  nsrc, dims = beamline.sampleDims()
+  samples = np.random.default_rng(11).random((n, nsrc + sum(dims)))
+
+  ref_tally = Tally(beamline.components)
+  ref = beamline.source.getBundle(n, samples=samples[:,:nsrc], dtype=np.float64)
+  beamline.propagate(ref, tally=ref_tally, samples=samples[:,nsrc:])
+
+  tally = Tally(beamline.components)
+  bundle = _kernelBody(beamline, samples, tally)
+  _assertSame(beamline, bundle, tally, ref, ref_tally)
+
+
+@pytest.mark.parametrize('make', [SXR, HXR])
+def test_compiled_matches_numpy(make):
+  pytest.importorskip('numba')
+  beamline = make()
+  ref_tally = Tally(beamline.components)
+  ref = beamline.runBundle(20000, np.random.default_rng(5), ref_tally, dtype=np.float64, compiled=False)
+  tally = Tally(beamline.components)
+  bundle = beamline.runBundle(20000, np.random.default_rng(5), tally, dtype=np.float64, compiled=True)
+  _assertSame(beamline, bundle, tally, ref, ref_tally)